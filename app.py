@@ -1,13 +1,34 @@
-from flask import Flask, jsonify, request
-import boto3
-from boto3.dynamodb.conditions import Key, Attr
+from flask import Flask, Response, jsonify, request, g, has_request_context, abort, stream_with_context
 from datetime import datetime, timedelta, timezone
 from flask_cors import CORS
 from decimal import Decimal
 import json
 import os
+import sys
+import io
+import csv
+import zlib
+import base64
+import gzip
+import pickle
+import hashlib
+import hmac
+import tempfile
+import stat
+import importlib
 from dotenv import load_dotenv
+try:
+    import brotli  # optional: enables Content-Encoding: br
+except ImportError:
+    brotli = None
 import time
+import random
+import threading
+import functools
+import heapq
+import bisect
+from collections import OrderedDict, Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables from .env file
 load_dotenv()
@@ -28,17 +49,62 @@ class DecimalEncoder(json.JSONEncoder):
 app.json_encoder = DecimalEncoder
 
 # DynamoDB Configuration from environment variables
-dynamodb = boto3.resource(
-    'dynamodb',
-    region_name=os.getenv('AWS_REGION', 'ap-southeast-1'),
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-)
+# boto3 is imported and the resource built on first use, so importing this
+# module stays cheap (serverless cold starts) and clients are reused afterwards
+_dynamodb = None
+_dynamodb_lock = threading.Lock()
+
+def get_dynamodb():
+    """Return the shared DynamoDB resource, creating it on first call"""
+    global _dynamodb
+    if _dynamodb is None:
+        with _dynamodb_lock:
+            if _dynamodb is None and os.getenv('DYNAMODB_BACKEND', 'aws') == 'local':
+                import local_dynamo
+                _dynamodb = local_dynamo.LocalDynamoDB()
+            elif _dynamodb is None:
+                import boto3
+                _dynamodb = boto3.resource(
+                    'dynamodb',
+                    region_name=os.getenv('AWS_REGION', 'ap-southeast-1'),
+                    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
+                )
+    return _dynamodb
+
+class LazyTable:
+    """Proxy for a DynamoDB Table that is bound on first attribute access"""
+
+    def __init__(self, name):
+        self.name = name
+        self._table = None
+
+    def resolve(self):
+        if self._table is None:
+            self._table = get_dynamodb().Table(self.name)
+        return self._table
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+def Key(name):
+    """Deferred boto3.dynamodb.conditions.Key (importing it pulls in boto3)"""
+    from boto3.dynamodb.conditions import Key as _Key
+    return _Key(name)
+
+# Tables (names are overridable, e.g. to point a replay instance at its own tables)
+presence_table = LazyTable(os.getenv('PRESENCE_TABLE', 'ProximitySensorData'))
+ambient_table = LazyTable(os.getenv('AMBIENT_TABLE', 'AmbientSensorData'))
+stress_table = LazyTable(os.getenv('STRESS_TABLE', 'FaceDetections'))
+presence_intervals_table = LazyTable(os.getenv('PRESENCE_INTERVALS_TABLE', 'PresenceIntervals'))
 
-# Tables
-presence_table = dynamodb.Table('ProximitySensorData')
-ambient_table = dynamodb.Table('AmbientSensorData')
-stress_table = dynamodb.Table('FaceDetections')
+def configure_dynamodb(resource):
+    """Swap the DynamoDB resource (e.g. for local_dynamo.LocalDynamoDB) and rebind tables"""
+    global _dynamodb
+    with _dynamodb_lock:
+        _dynamodb = resource
+    for table in (presence_table, ambient_table, stress_table, presence_intervals_table):
+        table._table = None
 
 # ============================================
 # HELPER FUNCTIONS
@@ -131,22 +197,76 @@ def calculate_sessions(raw_data, timeout_threshold=900): # 15min timeout
 
 def calculate_focus_score(sessions, total_time_hours):
     """Calculate focus score based on session consistency"""
-    if not sessions or total_time_hours == 0:
+    if not sessions:
         return 0
-    
     total_study_minutes = sum(s.get('duration_minutes', 0) for s in sessions)
+    return focus_score_from_totals(total_study_minutes, len(sessions), total_time_hours)
+
+def focus_score_from_totals(total_study_minutes, session_count, total_time_hours):
+    """Focus score from aggregate study minutes and session count"""
+    if not session_count or total_time_hours == 0:
+        return 0
+    
     total_available_minutes = total_time_hours * 60
     
     # Base score from presence percentage
     presence_ratio = min(total_study_minutes / total_available_minutes, 1.0)
     
     # Bonus for longer continuous sessions (fewer breaks)
-    avg_session_length = total_study_minutes / len(sessions) if sessions else 0
+    avg_session_length = total_study_minutes / session_count
     session_bonus = min(avg_session_length / 60, 0.2)  # Max 20% bonus for 60+ min sessions
     
     focus_score = (presence_ratio * 80) + (session_bonus * 100)
     return min(round(focus_score), 100)
 
+def sweep_session_thresholds(active_timestamps, thresholds, total_time_hours):
+    """Session count, study minutes and focus score for many timeout thresholds at once.
+
+    With sorted active timestamps, a threshold t splits the consecutive gaps
+    into those <= t (inside a session, adding to study time) and those > t
+    (session breaks). Sorting the gaps once with prefix sums answers each
+    threshold with one binary search, matching calculate_sessions(items, t).
+    """
+    gaps = [b - a for a, b in zip(active_timestamps, active_timestamps[1:])]
+    return sweep_session_gaps(gaps, 0, bool(active_timestamps), thresholds, total_time_hours)
+
+def sweep_session_intervals(intervals, thresholds, total_time_hours):
+    """sweep_session_thresholds over presence intervals.
+
+    Time inside a present interval always counts as study time, so only the
+    gaps between present intervals are swept; exact for thresholds of at
+    least the compaction max gap.
+    """
+    present = sorted((i for i in intervals if i.get('presence') is True), key=lambda i: i['startUnix'])
+    inside = sum(i['endUnix'] - i['startUnix'] for i in present)
+    gaps = [b['startUnix'] - a['endUnix'] for a, b in zip(present, present[1:])]
+    return sweep_session_gaps(gaps, inside, bool(present), thresholds, total_time_hours)
+
+def sweep_session_gaps(gaps, base_seconds, has_activity, thresholds, total_time_hours):
+    """Sweep core: gaps between activity, plus study seconds no threshold can split"""
+    gaps = sorted(gaps)
+    prefix = [0]
+    for gap in gaps:
+        prefix.append(prefix[-1] + gap)
+
+    results = []
+    for threshold in thresholds:
+        if not has_activity:
+            results.append({'thresholdSeconds': threshold, 'sessions': 0, 'totalStudyMinutes': 0,
+                            'averageSessionMinutes': 0, 'focusScore': 0})
+            continue
+        within = bisect.bisect_right(gaps, threshold)
+        session_count = len(gaps) - within + 1
+        total_minutes = (base_seconds + prefix[within]) / 60
+        results.append({
+            'thresholdSeconds': threshold,
+            'sessions': session_count,
+            'totalStudyMinutes': round(total_minutes, 2),
+            'averageSessionMinutes': round(total_minutes / session_count, 2),
+            'focusScore': focus_score_from_totals(total_minutes, session_count, total_time_hours)
+        })
+    return results
+
 def generate_insights(sensor_data, sessions, study_trends):
     """Generate smart insights based on sensor data and patterns"""
     insights = []
@@ -248,6 +368,1431 @@ def generate_insights(sensor_data, sessions, study_trends):
     
     return insights
 
+# ============================================
+# DYNAMODB CAPACITY BUDGET
+# ============================================
+
+THROTTLE_ERROR_CODES = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+
+class CapacityExhausted(Exception):
+    """Raised when a query would exceed the read budget or stays throttled after retries"""
+
+class ReadCapacityBudget:
+    """Token bucket of read capacity units refilled at `units_per_second`.
+
+    A query is admitted while the bucket is positive and is charged its
+    actual ConsumedCapacity afterwards, so large pages run the bucket into
+    debt and hold back the following queries. A rate of 0 disables it.
+    """
+
+    def __init__(self, units_per_second=0, burst=None):
+        self.units_per_second = units_per_second
+        self.burst = burst or units_per_second
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.units_per_second)
+        self._refilled_at = now
+
+    def try_acquire(self):
+        if not self.units_per_second:
+            return True
+        with self._lock:
+            self._refill()
+            return self._tokens > 0
+
+    def consume(self, units):
+        if not self.units_per_second:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens -= units
+
+    def available(self):
+        if not self.units_per_second:
+            return None
+        with self._lock:
+            self._refill()
+            return round(self._tokens, 2)
+
+read_budget = ReadCapacityBudget(
+    units_per_second=float(os.getenv('READ_CAPACITY_BUDGET', 0)),
+    burst=float(os.getenv('READ_CAPACITY_BURST', 0)) or None
+)
+QUERY_MAX_RETRIES = int(os.getenv('DYNAMODB_MAX_RETRIES', 4))
+QUERY_BACKOFF_BASE = float(os.getenv('DYNAMODB_BACKOFF_BASE_SECONDS', 0.05))
+QUERY_BACKOFF_CAP = float(os.getenv('DYNAMODB_BACKOFF_CAP_SECONDS', 2.0))
+
+# Per-endpoint totals: calls, consumed RCUs, throttles, retries, budget rejections
+capacity_stats = {}
+_capacity_stats_lock = threading.Lock()
+
+def _capacity_scope():
+    if has_request_context():
+        return request.endpoint or request.path
+    return threading.current_thread().name
+
+def _record_capacity(scope, **counts):
+    with _capacity_stats_lock:
+        stats = capacity_stats.setdefault(scope, {'calls': 0, 'consumedCapacity': 0.0, 'throttled': 0, 'retries': 0, 'rejected': 0})
+        for name, value in counts.items():
+            stats[name] += value
+
+def is_throttling_error(error):
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code in THROTTLE_ERROR_CODES
+
+def query_table(table, **kwargs):
+    """Query with read-budget admission, ConsumedCapacity tracking and jittered retries"""
+    scope = _capacity_scope()
+    if not read_budget.try_acquire():
+        _record_capacity(scope, rejected=1)
+        if has_request_context():
+            g.capacity_exhausted = True
+        raise CapacityExhausted('Read capacity budget exhausted')
+
+    kwargs.setdefault('ReturnConsumedCapacity', 'TOTAL')
+    for attempt in range(QUERY_MAX_RETRIES + 1):
+        try:
+            query_started = time.perf_counter()
+            response = table.query(**kwargs)
+            if has_request_context():
+                g.dynamodb_seconds = g.get('dynamodb_seconds', 0.0) + time.perf_counter() - query_started
+            break
+        except Exception as e:
+            if not is_throttling_error(e):
+                raise
+            _record_capacity(scope, throttled=1)
+            if attempt == QUERY_MAX_RETRIES:
+                if has_request_context():
+                    g.capacity_exhausted = True
+                raise CapacityExhausted(f"Throttled after {attempt + 1} attempts") from e
+            _record_capacity(scope, retries=1)
+            # Full jitter: sleep uniformly in [0, min(cap, base * 2^attempt)]
+            time.sleep(random.uniform(0, min(QUERY_BACKOFF_CAP, QUERY_BACKOFF_BASE * (2 ** attempt))))
+
+    heartbeat_index.observe_query(table, kwargs, response)
+    units = float(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0))
+    read_budget.consume(units)
+    _record_capacity(scope, calls=1, consumedCapacity=units)
+    if has_request_context():
+        g.consumed_capacity = g.get('consumed_capacity', 0.0) + units
+        g.dynamodb_calls = g.get('dynamodb_calls', 0) + 1
+    return response
+
+@app.after_request
+def add_consumed_capacity_header(response):
+    if 'consumed_capacity' in g:
+        response.headers['X-Consumed-Capacity'] = str(round(g.consumed_capacity, 2))
+    return response
+
+# ============================================
+# DEVICE HEARTBEATS
+# ============================================
+
+HEARTBEAT_CADENCE_SECONDS = float(os.getenv('HEARTBEAT_CADENCE_SECONDS', 5))  # firmware publishInterval
+HEARTBEAT_TOLERANCE_BEATS = float(os.getenv('HEARTBEAT_TOLERANCE_BEATS', 3))
+HEARTBEAT_WINDOW = 32  # newest readings kept per device for the rate estimate
+
+TABLE_KINDS = {presence_table.name: 'presence', ambient_table.name: 'ambient', stress_table.name: 'camera'}
+
+def _walk_condition(condition):
+    pending = [condition]
+    while pending:
+        expr = pending.pop().get_expression()
+        if expr['operator'] == 'AND':
+            pending.extend(expr['values'])
+        else:
+            yield expr['operator'], expr['values']
+
+def _query_scope(condition):
+    """(deviceId, reaches the newest readings?) for a key condition"""
+    device_id, reaches_now = None, True
+    now_iso = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    for operator, values in _walk_condition(condition):
+        if operator == '=' and values[0].name == 'deviceId':
+            device_id = values[1]
+        elif operator == 'BETWEEN' and values[2] < now_iso:
+            reaches_now = False
+        elif operator in ('<', '<=') and values[1] < now_iso:
+            reaches_now = False
+    return device_id, reaches_now
+
+class DeviceHeartbeatIndex:
+    """Last-seen time and message rate per device, fed by queries the backend already runs.
+
+    `checkedAt` is when a query last covered a device's newest readings, and
+    `lagAtCheckSeconds` how far behind the device was at that moment, so a
+    device is only flagged on evidence rather than because nobody looked.
+    """
+
+    def __init__(self, cadence, tolerance_beats):
+        self.cadence = cadence
+        self.tolerance_beats = tolerance_beats
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind, device_id, epochs, checked_at=None):
+        """Record reading times (ascending) for a device; checked_at marks a head-of-stream read"""
+        with self._lock:
+            state = self._devices.get((kind, device_id))
+            if state is None:
+                state = self._devices[(kind, device_id)] = {
+                    'recent': [], 'lastSeen': None, 'checkedAt': None, 'lagAtCheck': None
+                }
+            # Keep the newest HEARTBEAT_WINDOW distinct reading times, in order
+            recent = state['recent']
+            for epoch in epochs:
+                if len(recent) >= HEARTBEAT_WINDOW and epoch <= recent[0]:
+                    continue
+                idx = bisect.bisect_left(recent, epoch)
+                if idx == len(recent) or recent[idx] != epoch:
+                    recent.insert(idx, epoch)
+                    if len(recent) > HEARTBEAT_WINDOW:
+                        del recent[0]
+            if recent:
+                state['lastSeen'] = recent[-1]
+            if checked_at is not None and (state['checkedAt'] is None or checked_at >= state['checkedAt']):
+                state['checkedAt'] = checked_at
+                state['lagAtCheck'] = checked_at - state['lastSeen'] if state['lastSeen'] else None
+
+    def observe_query(self, table, query_kwargs, response):
+        kind = TABLE_KINDS.get(getattr(table, 'name', None))
+        condition = query_kwargs.get('KeyConditionExpression')
+        if kind is None or condition is None:
+            return
+        device_id, reaches_now = _query_scope(condition)
+        if device_id is None:
+            return
+        items = response.get('Items', [])
+        newest_first = query_kwargs.get('ScanIndexForward', True) is False
+        recent = items[:HEARTBEAT_WINDOW] if newest_first else items[-HEARTBEAT_WINDOW:]
+        epochs = sorted(reading_epoch(item) for item in recent if item.get('timestamp') or item.get('unixTimestamp'))
+        # Only a page that ends at the partition's newest item tells us the device is quiet
+        is_head = reaches_now and (newest_first and 'ExclusiveStartKey' not in query_kwargs
+                                   or not newest_first and 'LastEvaluatedKey' not in response)
+        self.observe(kind, device_id, epochs, checked_at=time.time() if is_head else None)
+
+    def snapshot(self):
+        now = time.time()
+        limit = self.cadence * self.tolerance_beats
+        with self._lock:
+            devices = [(key, dict(state, recent=list(state['recent']))) for key, state in self._devices.items()]
+        report = []
+        for (kind, device_id), state in sorted(devices):
+            recent, last_seen, lag = state['recent'], state['lastSeen'], state['lagAtCheck']
+            interval = (recent[-1] - recent[0]) / (len(recent) - 1) if len(recent) > 1 else None
+            if lag is None:
+                status = 'unknown' if last_seen is None else 'unverified'
+            elif lag > limit:
+                status = 'offline'
+            else:
+                # An "online" verdict only holds for as long as a device may be quiet
+                status = 'online' if now - state['checkedAt'] <= limit else 'unverified'
+            report.append({
+                'kind': kind,
+                'deviceId': device_id,
+                'status': status,
+                'lastSeen': datetime.fromtimestamp(last_seen, tz=timezone.utc).isoformat() if last_seen else None,
+                'ageSeconds': round(now - last_seen, 1) if last_seen else None,
+                'checkedAt': datetime.fromtimestamp(state['checkedAt'], tz=timezone.utc).isoformat() if state['checkedAt'] else None,
+                'checkAgeSeconds': round(now - state['checkedAt'], 1) if state['checkedAt'] else None,
+                'lagAtCheckSeconds': round(lag, 1) if lag is not None else None,
+                'missedBeats': max(int(lag // self.cadence) - 1, 0) if lag is not None else None,
+                'observedIntervalSeconds': round(interval, 2) if interval else None,
+                'messagesPerMinute': round(60 / interval, 1) if interval else None,
+                'cadenceOk': interval is not None and interval <= self.cadence * 1.5,
+            })
+        return report
+
+heartbeat_index = DeviceHeartbeatIndex(HEARTBEAT_CADENCE_SECONDS, HEARTBEAT_TOLERANCE_BEATS)
+
+# ============================================
+# SENSOR READING STREAMS
+# ============================================
+
+# Export name -> (table, default device, CSV columns)
+SENSOR_TABLES = {
+    'presence': (presence_table, 'esp32-ultrasonic', ['deviceId', 'timestamp', 'unixTimestamp', 'presence', 'distanceCm']),
+    'ambient': (ambient_table, 'esp32-light', ['deviceId', 'timestamp', 'unixTimestamp', 'ambientLux']),
+    'stress': (stress_table, 'esp32-camera', ['deviceId', 'timestamp', 'unixTimestamp', 'stressScore', 'primaryEmotion']),
+}
+
+def to_iso_timestamp(value):
+    """Normalize epoch seconds or an ISO-8601 string to the stored timestamp format"""
+    try:
+        dt = datetime.fromtimestamp(float(value), tz=timezone.utc)
+    except ValueError:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+def iter_readings(table, device_id, start_iso, end_iso, page_size=1000, exclusive_start_key=None, attributes=None):
+    """Yield a device's readings in timestamp order, one query page at a time"""
+    query_kwargs = {
+        'KeyConditionExpression': Key('deviceId').eq(device_id) & Key('timestamp').between(start_iso, end_iso),
+        'ScanIndexForward': True,
+        'Limit': page_size,
+    }
+    if attributes:
+        # Fetch only what the caller needs to cut transfer and deserialization
+        names = {f"#a{i}": name for i, name in enumerate(attributes)}
+        query_kwargs['ProjectionExpression'] = ', '.join(names)
+        query_kwargs['ExpressionAttributeNames'] = names
+    if exclusive_start_key:
+        query_kwargs['ExclusiveStartKey'] = exclusive_start_key
+    while True:
+        response = query_table(table, **query_kwargs)
+        for item in response.get('Items', []):
+            yield decimal_to_float(item)
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_key
+
+def reading_epoch(item):
+    """Epoch seconds of a reading (unixTimestamp when present, else the ISO timestamp)"""
+    if item.get('unixTimestamp'):
+        return float(item['unixTimestamp'])
+    return datetime.fromisoformat(item['timestamp'].replace('Z', '+00:00')).timestamp()
+
+def encode_continuation_token(item):
+    """Opaque resume token for the reading after `item` (its table key)"""
+    key = {'deviceId': item['deviceId'], 'timestamp': item['timestamp']}
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_continuation_token(token):
+    padded = token + '=' * (-len(token) % 4)
+    key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    return {'deviceId': key['deviceId'], 'timestamp': key['timestamp']}
+
+# ============================================
+# PRESENCE INTERVALS
+# ============================================
+
+# Compact tier for ProximitySensorData: one item per run of equal presence
+# readings (keyed like the raw table: deviceId + start timestamp). Runs are
+# split at hour boundaries and at reading gaps, so hourly buckets and
+# sessions computed from intervals match the raw-reading versions.
+PRESENCE_INTERVALS_ENABLED = os.getenv('PRESENCE_INTERVALS_ENABLED', 'False').lower() == 'true'
+PRESENCE_INTERVAL_MAX_GAP_SECONDS = float(os.getenv(
+    'PRESENCE_INTERVAL_MAX_GAP_SECONDS', HEARTBEAT_CADENCE_SECONDS * HEARTBEAT_TOLERANCE_BEATS))
+PRESENCE_COMPACTION_DELAY_SECONDS = int(os.getenv('PRESENCE_COMPACTION_DELAY_SECONDS', 600))
+RAW_RETENTION_DAYS = float(os.getenv('RAW_RETENTION_DAYS', 30))
+WATERMARK_TTL_SECONDS = int(os.getenv('PRESENCE_WATERMARK_TTL_SECONDS', 300))
+PRESENCE_ATTRIBUTES = ['deviceId', 'timestamp', 'unixTimestamp', 'presence', 'distanceCm']
+
+def floor_hour(epoch):
+    return int(epoch // 3600 * 3600)
+
+def compact_presence_intervals(items, max_gap=None):
+    """Run-length encode time-ordered presence readings into intervals.
+
+    A new interval starts when presence flips, when the gap to the previous
+    reading exceeds max_gap (device offline), or at an hour boundary.
+    """
+    max_gap = PRESENCE_INTERVAL_MAX_GAP_SECONDS if max_gap is None else max_gap
+    intervals = []
+    current = None
+    for item in items:
+        epoch = int(reading_epoch(item))
+        state = item.get('presence') is True
+        distance = float(item['distanceCm']) if item.get('distanceCm') is not None else None
+        if (current is None or state != current['presence'] or epoch - current['endUnix'] > max_gap
+                or floor_hour(epoch) != floor_hour(current['startUnix'])):
+            current = {
+                'deviceId': item.get('deviceId'),
+                'timestamp': to_iso_timestamp(epoch),
+                'startUnix': epoch,
+                'endUnix': epoch,
+                'presence': state,
+                'readings': 0,
+                'minDistanceCm': distance,
+                'maxDistanceCm': distance,
+            }
+            intervals.append(current)
+        current['endUnix'] = epoch
+        current['readings'] += 1
+        if distance is not None:
+            if current['minDistanceCm'] is None or distance < current['minDistanceCm']:
+                current['minDistanceCm'] = distance
+            if current['maxDistanceCm'] is None or distance > current['maxDistanceCm']:
+                current['maxDistanceCm'] = distance
+    for interval in intervals:
+        interval['endTimestamp'] = to_iso_timestamp(interval['endUnix'])
+    return intervals
+
+def calculate_sessions_from_intervals(intervals, timeout_threshold=900):
+    """calculate_sessions over presence intervals instead of raw readings.
+
+    Readings inside an interval are at most the compaction max gap apart,
+    so only the gaps between present intervals can end a session.
+    """
+    present = sorted((i for i in intervals if i.get('presence') is True), key=lambda i: i['startUnix'])
+    sessions = []
+    for interval in present:
+        start, end = int(interval['startUnix']), int(interval['endUnix'])
+        if sessions and start - sessions[-1]['end'] <= timeout_threshold:
+            sessions[-1]['end'] = max(sessions[-1]['end'], end)
+        else:
+            sessions.append({'start': start, 'end': end})
+    for session in sessions:
+        session['duration_minutes'] = round((session['end'] - session['start']) / 60, 2)
+    return sessions
+
+def hourly_presence_counts(intervals, utc_offset):
+    """{local hour start: {'total', 'present'}} reading counts from intervals"""
+    buckets = {}
+    for interval in intervals:
+        hour = datetime.fromtimestamp(floor_hour(interval['startUnix']), tz=timezone.utc) + utc_offset
+        counts = buckets.setdefault(hour, {'total': 0, 'present': 0})
+        counts['total'] += int(interval['readings'])
+        if interval.get('presence') is True:
+            counts['present'] += int(interval['readings'])
+    return buckets
+
+def clip_interval(interval, start_epoch, end_epoch):
+    """Trim an interval to [start_epoch, end_epoch], apportioning its readings by time"""
+    start, end = max(interval['startUnix'], start_epoch), min(interval['endUnix'], end_epoch)
+    if start > end:
+        return None
+    if (start, end) == (interval['startUnix'], interval['endUnix']):
+        return interval
+    span = interval['endUnix'] - interval['startUnix'] + HEARTBEAT_CADENCE_SECONDS
+    kept = (end - start + HEARTBEAT_CADENCE_SECONDS) / span
+    clipped = dict(interval, startUnix=int(start), endUnix=int(end),
+                   timestamp=to_iso_timestamp(start), endTimestamp=to_iso_timestamp(end))
+    clipped['readings'] = max(1, round(interval['readings'] * kept))
+    return clipped
+
+def fetch_compaction_watermark(device_id):
+    """Start of the first hour not yet compacted for a device (0 if none is)"""
+    response = query_table(
+        presence_intervals_table,
+        KeyConditionExpression=Key('deviceId').eq(device_id),
+        ScanIndexForward=False,
+        Limit=1
+    )
+    items = response.get('Items', [])
+    return floor_hour(float(items[0]['endUnix'])) + 3600 if items else 0
+
+def compaction_watermark(device_id):
+    # Own scope: ingest invalidates 'device:<id>' but cannot move the watermark
+    entry = cache_store.get('intervals:' + device_id, 'watermark')
+    if entry is not None:
+        return entry['value']
+    watermark = fetch_compaction_watermark(device_id)
+    cache_store.set('intervals:' + device_id, 'watermark', {'value': watermark}, WATERMARK_TTL_SECONDS)
+    return watermark
+
+def fetch_raw_presence_horizon(device_id):
+    """Start of the oldest hour still held as raw rows, or 0 if no compacted hour was expired"""
+    oldest_interval = query_table(presence_intervals_table, KeyConditionExpression=Key('deviceId').eq(device_id),
+                                  Limit=1).get('Items', [])
+    if not oldest_interval:
+        return 0
+    oldest_raw = query_table(presence_table, KeyConditionExpression=Key('deviceId').eq(device_id),
+                             Limit=1).get('Items', [])
+    if not oldest_raw:
+        return fetch_compaction_watermark(device_id)
+    # Intervals only come from raw rows, so older intervals mean those rows were expired
+    horizon = floor_hour(reading_epoch(decimal_to_float(oldest_raw[0])))
+    return horizon if float(oldest_interval[0]['startUnix']) < horizon else 0
+
+def raw_presence_horizon(device_id):
+    """Epoch before which raw presence rows may have been deleted (0 when all are kept)"""
+    if not PRESENCE_INTERVALS_ENABLED:
+        return 0
+    entry = cache_store.get('intervals:' + device_id, 'rawHorizon')
+    if entry is not None:
+        return entry['value']
+    horizon = fetch_raw_presence_horizon(device_id)
+    cache_store.set('intervals:' + device_id, 'rawHorizon', {'value': horizon}, WATERMARK_TTL_SECONDS)
+    return horizon
+
+def presence_intervals(device_id, start_iso, end_iso):
+    """Presence intervals of a device between two timestamps.
+
+    Compacted hours come from the intervals table; readings after the
+    compaction watermark (or all of them when the compact tier is disabled)
+    are compacted on the fly.
+    """
+    start_epoch = reading_epoch({'timestamp': start_iso})
+    end_epoch = reading_epoch({'timestamp': end_iso})
+    watermark = compaction_watermark(device_id) if PRESENCE_INTERVALS_ENABLED else 0
+
+    intervals = []
+    if start_epoch < watermark:
+        stored = iter_readings(presence_intervals_table, device_id,
+                               to_iso_timestamp(floor_hour(start_epoch)), min(end_iso, to_iso_timestamp(watermark - 0.001)))
+        for interval in stored:
+            clipped = clip_interval(interval, start_epoch, end_epoch)
+            if clipped is not None:
+                intervals.append(clipped)
+    if end_epoch >= watermark:
+        raw = iter_readings(presence_table, device_id, max(start_iso, to_iso_timestamp(watermark)), end_iso,
+                            attributes=PRESENCE_ATTRIBUTES)
+        intervals.extend(compact_presence_intervals(raw))
+    return intervals
+
+def interval_item(interval):
+    """Interval as a DynamoDB item (numbers as Decimal, unset distances dropped)"""
+    item = {}
+    for name, value in interval.items():
+        if value is None:
+            continue
+        item[name] = Decimal(str(value)) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+    return item
+
+def compact_presence(device_id, now=None, retention_days=None):
+    """Compact closed hours of raw presence readings, then expire old raw rows.
+
+    Resumes from the hour of the newest stored interval, so rerunning after
+    a failure rewrites the same items. Raw rows are deleted only once they
+    are both older than the retention period and compacted, and only while
+    PRESENCE_INTERVALS_ENABLED, since otherwise the API still reads them.
+    """
+    now = time.time() if now is None else now
+    retention_days = RAW_RETENTION_DAYS if retention_days is None else retention_days
+    end = floor_hour(now - PRESENCE_COMPACTION_DELAY_SECONDS)
+
+    newest = query_table(presence_intervals_table, KeyConditionExpression=Key('deviceId').eq(device_id),
+                         ScanIndexForward=False, Limit=1).get('Items', [])
+    if newest:
+        start = floor_hour(float(newest[0]['startUnix']))
+    else:
+        oldest = query_table(presence_table, KeyConditionExpression=Key('deviceId').eq(device_id),
+                             Limit=1).get('Items', [])
+        start = floor_hour(reading_epoch(decimal_to_float(oldest[0]))) if oldest else end
+
+    readings = written = 0
+    # One day per pass keeps memory flat on a first run over months of rows
+    for chunk_start in range(start, end, 86400):
+        chunk_end = min(chunk_start + 86400, end)
+        raw = iter_readings(presence_table, device_id, to_iso_timestamp(chunk_start),
+                            to_iso_timestamp(chunk_end - 0.001), attributes=PRESENCE_ATTRIBUTES)
+        intervals = compact_presence_intervals(raw)
+        with presence_intervals_table.batch_writer() as batch:
+            for interval in intervals:
+                batch.put_item(Item=interval_item(interval))
+        readings += sum(interval['readings'] for interval in intervals)
+        written += len(intervals)
+
+    watermark = fetch_compaction_watermark(device_id)
+    cache_store.set('intervals:' + device_id, 'watermark', {'value': watermark}, WATERMARK_TTL_SECONDS)
+
+    deleted = 0
+    cutoff = min(floor_hour(now - retention_days * 86400), watermark)
+    if PRESENCE_INTERVALS_ENABLED and retention_days >= 0 and cutoff > 0:  # negative retention keeps raw rows forever
+        expired = iter_readings(presence_table, device_id, '1970-01-01T00:00:00.000Z',
+                                to_iso_timestamp(cutoff - 0.001), attributes=['deviceId', 'timestamp'])
+        with presence_table.batch_writer() as batch:
+            for item in expired:
+                batch.delete_item(Key={'deviceId': item['deviceId'], 'timestamp': item['timestamp']})
+                deleted += 1
+        cache_store.set('intervals:' + device_id, 'rawHorizon', {'value': fetch_raw_presence_horizon(device_id)},
+                        WATERMARK_TTL_SECONDS)
+
+    return {
+        'deviceId': device_id,
+        'readingsCompacted': readings,
+        'intervalsWritten': written,
+        'compactedThrough': to_iso_timestamp(watermark) if watermark else None,
+        'rawDeleted': deleted,
+        'rawRetention': 'enforced' if PRESENCE_INTERVALS_ENABLED and retention_days >= 0 else 'kept'
+    }
+
+# ============================================
+# PRECOMPUTED INSIGHTS
+# ============================================
+
+def compute_insights(device_id='esp32-ultrasonic'):
+    """Run the full insights pipeline for a presence device"""
+    hours = 24
+    cutoff_dt = datetime.now(timezone.utc) - timedelta(hours=hours)
+    cutoff_iso_string = cutoff_dt.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+    now_iso = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.999Z')
+    sessions = calculate_sessions_from_intervals(presence_intervals(device_id, cutoff_iso_string, now_iso))
+
+    # Get latest sensor reading
+    latest_presence = latest_reading(presence_table, device_id)
+
+    latest_ambience = latest_reading(ambient_table, 'esp32-light')
+
+    latest_camera = latest_reading(stress_table, 'esp32-camera')
+
+    raw_light = latest_ambience['Items'][0].get('ambientLux') if latest_ambience.get('Items') else None
+    light_level = sanitize_light_level(raw_light)
+
+    presence_detected = latest_presence['Items'][0].get('presence', False) if latest_presence.get('Items') else False
+    stress_level = latest_camera['Items'][0].get('stressScore', 0.0) if latest_camera.get('Items') else 0.0
+
+    sensor_data = {
+        'lightLevel': light_level,  # Can be None
+        'lightSensorConnected': light_level is not None,
+        'presenceDetected': presence_detected,
+        'stressLevel': stress_level
+    }
+
+    # Get study trends for insights
+    study_trends_response = get_study_trends_internal(7, device_id)
+
+    insights = generate_insights(sensor_data, sessions, study_trends_response.get('trends', []))
+
+    return {
+        'insights': decimal_to_float(insights),
+        'sourceTimestamp': latest_sensor_timestamps(latest_presence, latest_ambience, latest_camera)
+    }
+
+def latest_sensor_timestamps(*responses):
+    """Timestamps of the newest item in each Limit=1 query response (None if empty)"""
+    return tuple(r['Items'][0].get('timestamp') if r.get('Items') else None for r in responses)
+
+def fetch_latest_sensor_timestamps(device_id='esp32-ultrasonic'):
+    """Cheap Limit=1 probe used to detect that new readings have arrived"""
+    responses = []
+    for table, dev in ((presence_table, device_id), (ambient_table, 'esp32-light'), (stress_table, 'esp32-camera')):
+        responses.append(query_table(
+            table,
+            KeyConditionExpression=Key('deviceId').eq(dev),
+            ScanIndexForward=False,
+            Limit=1,
+            ProjectionExpression='#ts',
+            ExpressionAttributeNames={'#ts': 'timestamp'}
+        ))
+    return latest_sensor_timestamps(*responses)
+
+class InsightsView:
+    """Materialized insights per device, refreshed by a background thread.
+
+    A device is recomputed when its newest readings change or when its entry
+    is older than max_age seconds, checked every refresh_interval seconds.
+    Only the configured devices are materialized.
+    """
+
+    def __init__(self, devices=(), refresh_interval=30, max_age=300):
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.configured = frozenset(devices)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def get(self, device_id):
+        with self._lock:
+            return self._entries.get(device_id)
+
+    def devices(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def serves(self, device_id):
+        return device_id in self.configured
+
+    @staticmethod
+    def compute(device_id):
+        """Build an entry for one device without storing it"""
+        result = compute_insights(device_id)
+        now = time.time()
+        return {
+            'insights': result['insights'],
+            'sourceTimestamp': result['sourceTimestamp'],
+            'computedAtUnix': now,
+            'computedAt': datetime.fromtimestamp(now, tz=timezone.utc).isoformat()
+        }
+
+    def refresh(self, device_id):
+        """Recompute and store insights for one device, returning the new entry.
+
+        CapacityExhausted propagates before anything is stored, so a degraded
+        refresh leaves the previous entry in place.
+        """
+        entry = self.compute(device_id)
+        with self._lock:
+            self._entries[device_id] = entry
+        return entry
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def refresh_if_stale(self, device_id):
+        entry = self.get(device_id)
+        if entry is not None and time.time() - entry['computedAtUnix'] < self.max_age:
+            if fetch_latest_sensor_timestamps(device_id) == entry['sourceTimestamp']:
+                return entry
+        return self.refresh(device_id)
+
+    def start(self):
+        """Start the background refresh thread (idempotent)"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            for device_id in self.configured:
+                self._entries.setdefault(device_id, None)
+        self._thread = threading.Thread(target=self._run, name='insights-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            for device_id in self.devices():
+                try:
+                    self.refresh_if_stale(device_id)
+                except Exception as e:
+                    print(f"Error refreshing insights for {device_id}: {e}")
+            self._stop.wait(self.refresh_interval)
+
+insights_view = InsightsView(
+    devices=[d for d in os.getenv('INSIGHTS_DEVICES', 'esp32-ultrasonic').split(',') if d],
+    refresh_interval=int(os.getenv('INSIGHTS_REFRESH_SECONDS', 30)),
+    max_age=int(os.getenv('INSIGHTS_MAX_AGE_SECONDS', 300))
+)
+
+# ============================================
+# RESPONSE CACHE
+# ============================================
+
+# Query flags that change how a request is handled, not what it returns
+CACHE_IGNORED_ARGS = ('profile',)
+
+def cache_key(path, args, defaults=None):
+    """Normalize a route and its query args into a cache key"""
+    params = dict(defaults or {})
+    params.update({k: v for k, v in args.items() if v != '' and k not in CACHE_IGNORED_ARGS})
+    return path + '?' + '&'.join(f"{k}={params[k]}" for k in sorted(params))
+
+class MemoryCacheBackend:
+    """Per-process LRU backend (the default)"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def incr(self, name):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+            return self._counters[name]
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+class FileCacheBackend:
+    """Entries pickled into a directory shared by all worker processes on the host.
+
+    Defaults to /dev/shm when available, so it behaves like shared memory.
+    Writes go to a temp file and os.replace() into place, so readers never
+    see partial entries. Counters are updated under an flock. When the
+    directory grows past max_bytes, the least recently used files (by
+    mtime, which reads refresh) are removed. Since entries are unpickled,
+    the directory must be owned by this user and closed to everyone else.
+    """
+
+    def __init__(self, directory=None, max_bytes=64 * 1024 * 1024):
+        default_root = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        self.directory = directory or os.path.join(default_root, f'study-dashboard-cache-{os.getuid()}')
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self._check_directory()
+        self._writes = 0
+
+    def _check_directory(self):
+        # A directory planted by another user could hold pickles that run code when loaded
+        info = os.lstat(self.directory)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise RuntimeError(f"Cache directory {self.directory} must be a directory owned by uid "
+                               f"{os.getuid()} with mode 0700 (found uid {info.st_uid}, mode {oct(info.st_mode & 0o777)})")
+
+    def _path(self, key, prefix='e-'):
+        return os.path.join(self.directory, prefix + hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+            os.utime(path)
+            return entry
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, entry):
+        self._write(self._path(key), pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+        self._writes += 1
+        if self._writes % 64 == 0:
+            self.evict()
+
+    def counter(self, name):
+        try:
+            with open(self._path(name, 'c-'), 'r') as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def incr(self, name):
+        import fcntl  # POSIX only, like the shared directory itself
+        with open(os.path.join(self.directory, '.counters.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            value = self.counter(name) + 1
+            self._write(self._path(name, 'c-'), str(value).encode())
+            return value
+
+    def evict(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('e-'):
+                try:
+                    info = entry.stat()
+                    files.append((info.st_mtime, info.st_size, entry.path))
+                except OSError:
+                    continue
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
+    def size(self):
+        return sum(1 for entry in os.scandir(self.directory) if entry.name.startswith('e-'))
+
+def make_cache_backend(spec):
+    """Build a backend from CACHE_BACKEND: 'memory', 'file' or 'package.module:ClassName'"""
+    if spec == 'memory':
+        return MemoryCacheBackend(max_entries=int(os.getenv('CACHE_MAX_ENTRIES', 512)))
+    if spec == 'file':
+        return FileCacheBackend(os.getenv('CACHE_DIR'), int(os.getenv('CACHE_MAX_BYTES', 64 * 1024 * 1024)))
+    # Any object with get/set/counter/incr/size, e.g. a client for a local key-value service
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+class CacheStore:
+    """TTL entries grouped into scopes that can be invalidated atomically.
+
+    Keys embed the scope's generation counter, so bumping it makes every
+    entry of the scope unreachable in one step for all processes sharing
+    the backend; orphaned entries age out through the backend's eviction.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, scope, key):
+        return f"{scope}@{self.backend.counter('gen:' + scope)}|{key}"
+
+    def get(self, scope, key, allow_stale=False):
+        entry = self.backend.get(self._key(scope, key))
+        if entry is None or (not allow_stale and (entry['expiresAt'] <= time.time() or not self.is_current(entry))):
+            if not allow_stale:
+                self.misses += 1
+            return None
+        if not allow_stale:
+            self.hits += 1
+        return entry
+
+    def set(self, scope, key, fields, ttl, depends_on=()):
+        """Store an entry; it also goes invalid when any `depends_on` scope is invalidated"""
+        now = time.time()
+        entry = dict(fields, _key=self._key(scope, key), storedAt=now, expiresAt=now + ttl,
+                     dependsOn={s: self.backend.counter('gen:' + s) for s in depends_on})
+        self.backend.set(entry['_key'], entry)
+        return entry
+
+    def is_current(self, entry):
+        return all(self.backend.counter('gen:' + s) == gen for s, gen in entry.get('dependsOn', {}).items())
+
+    def update(self, entry):
+        """Write back an entry after adding derived data (e.g. compressed bodies)"""
+        self.backend.set(entry['_key'], entry)
+
+    def invalidate(self, scope):
+        return self.backend.incr('gen:' + scope)
+
+cache_store = CacheStore(make_cache_backend(os.getenv('CACHE_BACKEND', 'memory')))
+
+def invalidate_on_ingest(device_id=None, epochs=()):
+    """Drop cached data affected by newly ingested readings.
+
+    Closed-day sessions live in their own scope and are only dropped when a
+    reading lands in a day that has already ended (a backfill); live
+    readings cannot change them.
+    """
+    if device_id:
+        cache_store.invalidate('device:' + device_id)
+        if epochs:
+            # Day windows are UTC days or SGT (UTC+8) days; the later start of "today" bounds the closed ones
+            now = time.time()
+            closed_before = max(now // 86400 * 86400, (now + 8 * 3600) // 86400 * 86400 - 8 * 3600)
+            if min(epochs) < closed_before:
+                cache_store.invalidate('sessions:' + device_id)
+        # Only responses built from this device's readings
+        cache_store.invalidate('responses:' + device_id)
+    else:
+        cache_store.invalidate('responses')
+
+STALE_RESPONSE_TTL_SECONDS = int(os.getenv('STALE_RESPONSE_TTL_SECONDS', 24 * 3600))
+
+class ResponseCache:
+    """Serialized JSON endpoint responses, kept in the shared cache store.
+
+    Entries depend on a 'responses:<deviceId>' scope per device they read,
+    so ingest for one device leaves the others cached. Each body is also
+    kept in a 'stale' scope that invalidation does not bump, so the last
+    good response survives ingest for degraded serving.
+    """
+
+    scope = 'responses'
+    stale_scope = 'stale'
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, key):
+        """Return the entry if present and fresh, else None"""
+        return self.store.get(self.scope, key)
+
+    def get_stale(self, key):
+        """Return the last good entry even if expired or invalidated (for degraded responses)"""
+        return self.store.get(self.stale_scope, key, allow_stale=True)
+
+    def expires_in(self, key):
+        """Seconds until the entry expires (negative/None if expired or missing)"""
+        entry = self.store.get(self.scope, key, allow_stale=True)
+        return entry['expiresAt'] - time.time() if entry and self.store.is_current(entry) else None
+
+    def set(self, key, body, ttl, devices=()):
+        self.store.set(self.stale_scope, key, {'body': body}, STALE_RESPONSE_TTL_SECONDS)
+        return self.store.set(self.scope, key, {'body': body, 'encoded': {}}, ttl,
+                              depends_on=['responses:' + d for d in devices])
+
+    def invalidate(self):
+        self.store.invalidate(self.scope)
+
+    def stats(self):
+        return {
+            'backend': type(self.store.backend).__name__,
+            'entries': self.store.backend.size(),
+            'hits': self.store.hits,
+            'misses': self.store.misses
+        }
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key onto one execution.
+
+    The first caller (the leader) runs the function; callers arriving while
+    it is in flight wait and receive the same result or exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.collapsed = 0
+        self.collapsed_by_route = {}
+
+    def do(self, key, fn, route=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'event': threading.Event(), 'result': None, 'error': None}
+                self.leaders += 1
+            else:
+                self.collapsed += 1
+                if route:
+                    self.collapsed_by_route[route] = self.collapsed_by_route.get(route, 0) + 1
+
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'leaders': self.leaders,
+                'collapsed': self.collapsed,
+                'inFlight': len(self._calls),
+                'collapsedByRoute': dict(self.collapsed_by_route)
+            }
+
+single_flight = SingleFlight()
+response_cache = ResponseCache(cache_store)
+CACHE_TTL_SECONDS = int(os.getenv('CACHE_TTL_SECONDS', 30))
+LATEST_READING_TTL_SECONDS = float(os.getenv('LATEST_READING_TTL_SECONDS', 5))
+SESSIONS_CACHE_TTL_SECONDS = int(os.getenv('SESSIONS_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+
+def latest_reading(table, device_id):
+    """Newest item of a device (Limit=1 query), cached for one publish interval"""
+    key = 'latest:' + table.name
+    entry = cache_store.get('device:' + device_id, key)
+    if entry is not None:
+        return entry['value']
+    response = query_table(
+        table,
+        KeyConditionExpression=Key('deviceId').eq(device_id),
+        ScanIndexForward=False,
+        Limit=1
+    )
+    value = {'Items': response.get('Items', [])}
+    cache_store.set('device:' + device_id, key, {'value': value}, LATEST_READING_TTL_SECONDS)
+    return value
+
+def day_sessions(device_id, start_iso, end_iso):
+    """calculate_sessions for one day window; windows that have ended are cached"""
+    closed = end_iso < datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    key = f"sessions:{start_iso}:{end_iso}"
+    if closed:
+        entry = cache_store.get('sessions:' + device_id, key)
+        if entry is not None:
+            return entry['value']
+
+    sessions = calculate_sessions_from_intervals(presence_intervals(device_id, start_iso, end_iso))
+
+    if closed:
+        cache_store.set('sessions:' + device_id, key, {'value': sessions}, SESSIONS_CACHE_TTL_SECONDS)
+    return sessions
+
+# Device ids per device kind, used to decide what to warm: the configured
+# ones plus any that have sent readings through /api/ingest
+known_devices = {
+    'presence': set(d for d in os.getenv('PRESENCE_DEVICES', 'esp32-ultrasonic').split(',') if d),
+    'camera': set(d for d in os.getenv('CAMERA_DEVICES', 'esp32-camera').split(',') if d),
+}
+
+_known_devices_lock = threading.Lock()
+
+def remember_device(kind, device_id):
+    if device_id:
+        with _known_devices_lock:
+            known_devices[kind].add(device_id)
+
+def devices_of_kind(kind):
+    with _known_devices_lock:
+        return sorted(known_devices[kind])
+
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+COMPRESSORS = {'gzip': lambda body: gzip.compress(body, compresslevel=6)}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=5)
+
+def negotiate_encoding(body):
+    """Pick br or gzip from Accept-Encoding, or None below the size threshold"""
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return None
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in COMPRESSORS and accepted[encoding]:
+            return encoding
+    return None
+
+def make_json_response(body, status_code=200, mimetype='application/json', entry=None):
+    """Build a response, compressing once per cache entry and encoding"""
+    encoding = negotiate_encoding(body)
+    if encoding:
+        encoded = entry['encoded'].get(encoding) if entry is not None else None
+        if encoded is None:
+            encoded = COMPRESSORS[encoding](body)
+            if entry is not None:
+                entry['encoded'][encoding] = encoded
+                cache_store.update(entry)
+        body = encoded
+    response = app.response_class(body, status=status_code, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def make_cached_response(entry, status):
+    response = make_json_response(entry['body'], entry=entry)
+    response.headers['X-Cache'] = status
+    response.headers['Age'] = str(int(time.time() - entry['storedAt']))
+    return response
+
+def make_stale_response(entry):
+    """Serve an expired entry marked as stale (used when DynamoDB capacity runs out)"""
+    payload = json.loads(entry['body'])
+    if isinstance(payload, dict):
+        payload['stale'] = True
+        payload['staleAgeSeconds'] = int(time.time() - entry['storedAt'])
+    response = app.response_class(json.dumps(payload), mimetype='application/json')
+    response.headers['X-Cache'] = 'STALE'
+    response.headers['Warning'] = '110 - "Response is Stale"'
+    return response
+
+def response_devices(args, defaults):
+    """Device ids a cached response reads: its deviceId / *DeviceId args or their defaults"""
+    params = dict(defaults)
+    params.update(args.items())
+    return sorted({v for k, v in params.items() if (k == 'deviceId' or k.endswith('DeviceId')) and v})
+
+def cached_response(ttl=None, devices=None, **defaults):
+    """Cache successful JSON responses of a view keyed by path and normalized args.
+
+    Bodies are compressed per Accept-Encoding and the compressed bytes are
+    kept on the entry, so hits skip both serialization and compression.
+    Concurrent misses for the same key share one computation. A ttl of 0
+    only coalesces (the entry is kept solely as a stale fallback). Requests
+    sent with `Cache-Control: no-cache` skip the lookup and refresh the
+    entry; this is also how the warmer repopulates it. When the read budget
+    is exhausted or DynamoDB keeps throttling, the last stored response is
+    served marked stale, or a 503 if there is none. Entries are invalidated
+    by ingest for the devices they read: `devices` when the view reads fixed
+    devices, otherwise those named by its deviceId-style args.
+    """
+    ttl = CACHE_TTL_SECONDS if ttl is None else ttl
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = cache_key(request.path, request.args, defaults)
+            if ttl > 0 and 'no-cache' not in request.headers.get('Cache-Control', ''):
+                entry = response_cache.get(key)
+                if entry is not None:
+                    return make_cached_response(entry, 'HIT')
+
+            def compute():
+                response = app.make_response(view(*args, **kwargs))
+                body = response.get_data()
+                degraded = g.get('capacity_exhausted', False)
+                entry = None
+                if response.status_code == 200 and not degraded:
+                    entry = response_cache.set(key, body, ttl, devices or response_devices(request.args, defaults))
+                return body, response.status_code, response.mimetype, degraded, entry
+
+            body, status_code, mimetype, degraded, entry = single_flight.do(key, compute, route=request.path)
+            if degraded:
+                entry = response_cache.get_stale(key)
+                if entry is not None:
+                    return make_stale_response(entry)
+                response = jsonify({'error': 'DynamoDB read capacity exhausted, retry shortly'})
+                response.status_code = 503
+                response.headers['Retry-After'] = '1'
+                return response
+
+            response = make_json_response(body, status_code, mimetype, entry)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+# ============================================
+# CACHE WARMING
+# ============================================
+
+# The query variants StudyDashboard.jsx fetchAllData requests for day/week views
+WARM_VARIANTS = [
+    ('/api/study_trends', 'presence', {'days': '1'}),
+    ('/api/study_trends', 'presence', {'days': '7'}),
+    ('/api/productivity', 'presence', {'days': '1'}),
+    ('/api/productivity', 'presence', {'days': '7'}),
+    ('/api/stress_history', 'camera', {'hours': '6'}),
+    ('/api/stress_history', 'camera', {'hours': '24'}),
+    ('/api/presence_history', 'presence', {'hours': '24'}),
+    ('/api/presence_history', 'presence', {'hours': '168'}),
+]
+
+_live_requests = 0
+_live_requests_lock = threading.Lock()
+
+@app.before_request
+def track_live_request_start():
+    global _live_requests
+    with _live_requests_lock:
+        _live_requests += 1
+
+@app.teardown_request
+def track_live_request_end(exc):
+    global _live_requests
+    with _live_requests_lock:
+        _live_requests -= 1
+
+def live_request_count():
+    with _live_requests_lock:
+        return _live_requests
+
+class CacheWarmer:
+    """Keeps dashboard query variants cached ahead of expiry and at day rollover.
+
+    At most `concurrency` warm-ups run at once, and new ones are held back
+    while more than `max_live_requests` client requests are in flight.
+    """
+
+    def __init__(self, tick=5, lead=10, concurrency=2, max_live_requests=4):
+        self.tick = tick
+        self.lead = lead
+        self.concurrency = concurrency
+        self.max_live_requests = max_live_requests
+        self.warmed = 0
+        self.failed = 0
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_day = None
+
+    def jobs(self):
+        """(path, args) pairs for every variant and known device"""
+        jobs = []
+        for path, kind, args in WARM_VARIANTS:
+            for device_id in devices_of_kind(kind):
+                jobs.append((path, dict(args, deviceId=device_id)))
+        return jobs
+
+    def warm(self, path, args):
+        """Recompute one variant through its view so it lands in the cache"""
+        with app.test_request_context(path, query_string=args, headers={'Cache-Control': 'no-cache'}):
+            response = app.view_functions[request.url_rule.endpoint](**request.view_args)
+        if response.status_code == 200:
+            self.warmed += 1
+        else:
+            self.failed += 1
+
+    def run_once(self, force=False):
+        """Warm every variant that is missing or about to expire"""
+        pending = []
+        for path, args in self.jobs():
+            remaining = response_cache.expires_in(cache_key(path, args))
+            if force or remaining is None or remaining < self.lead:
+                while live_request_count() > self.max_live_requests and not self._stop.is_set():
+                    self._stop.wait(0.1)
+                pending.append(self._executor.submit(self.warm, path, args))
+        for future in pending:
+            try:
+                future.result()
+            except Exception as e:
+                self.failed += 1
+                print(f"Error warming cache: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='cache-warm')
+        self._thread = threading.Thread(target=self._run, name='cache-warmer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        sgt_offset = timedelta(hours=8)
+        while not self._stop.is_set():
+            # Day buckets are SGT based, so re-warm everything when the SGT date changes
+            today = (datetime.now(timezone.utc) + sgt_offset).date()
+            rollover = self._last_day is not None and today != self._last_day
+            self._last_day = today
+            try:
+                self.run_once(force=rollover)
+            except Exception as e:
+                print(f"Error in cache warmer: {e}")
+            self._stop.wait(self.tick)
+
+    def stats(self):
+        return {'warmed': self.warmed, 'failed': self.failed, 'concurrency': self.concurrency}
+
+cache_warmer = CacheWarmer(
+    tick=int(os.getenv('CACHE_WARM_TICK_SECONDS', 5)),
+    lead=int(os.getenv('CACHE_WARM_LEAD_SECONDS', 10)),
+    concurrency=int(os.getenv('CACHE_WARM_CONCURRENCY', 2)),
+    max_live_requests=int(os.getenv('CACHE_WARM_MAX_LIVE_REQUESTS', 4))
+)
+
+# ============================================
+# REQUEST PROFILING
+# ============================================
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 1.0))
+PROFILE_INTERVAL_SECONDS = float(os.getenv('PROFILE_INTERVAL_MS', 2)) / 1000
+recent_profiles = deque(maxlen=int(os.getenv('PROFILE_HISTORY', 50)))
+
+# Phases spent waiting rather than computing
+PROFILE_IO_PHASES = ('dynamodb_io', 'coalesced_wait')
+_IO_FILES = ('/ssl.py', '/socket.py', '/selectors.py', '/http/client.py', '/urllib3/', 'local_dynamo.py')
+_DESERIALIZE_FILES = ('/botocore/parsers.py', '/boto3/dynamodb/types.py', '/boto3/dynamodb/transform.py')
+
+# Session detection on raw readings or on compacted presence intervals
+_SESSION_FUNCTIONS = frozenset((
+    'calculate_sessions', 'compact_presence_intervals', 'calculate_sessions_from_intervals',
+    'hourly_presence_counts', 'sweep_session_gaps',
+))
+
+def classify_sample(frames):
+    """Attribute one stack sample (innermost frame first) to a phase"""
+    waiting = False
+    for filename, func in frames:
+        if func == 'wait' and filename.endswith('/threading.py'):
+            waiting = True
+        if func == 'decimal_to_float':
+            return 'decimal_to_float'
+        if func in _SESSION_FUNCTIONS:
+            return 'calculate_sessions'
+        if func == 'do' and filename == __file__ and waiting:
+            return 'coalesced_wait'
+        if filename.endswith('/json/encoder.py') or '/flask/json/' in filename:
+            return 'json_encode'
+        if any(part in filename for part in _DESERIALIZE_FILES):
+            return 'boto3_deserialize'
+        if any(part in filename for part in _IO_FILES):
+            return 'dynamodb_io'
+    return 'other'
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval from a helper thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.phases = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append((code.co_filename, code.co_name))
+                frame = frame.f_back
+            if not frames:
+                continue
+            self.samples += 1
+            self.phases[classify_sample(frames)] += 1
+            # Collapsed-stack format: root;...;leaf
+            self.stacks[';'.join(f"{name} ({os.path.basename(filename)})" for filename, name in reversed(frames))] += 1
+
+def profiling_requested():
+    flag = request.headers.get('X-Profile') or request.args.get('profile')
+    return flag in ('1', 'true') and random.random() < PROFILE_SAMPLE_RATE
+
+@app.before_request
+def start_request_profile():
+    if PROFILING_ENABLED and profiling_requested():
+        g.profile_started = (time.perf_counter(), time.thread_time())
+        g.profile_sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_SECONDS)
+        g.profile_sampler.start()
+
+@app.after_request
+def finish_request_profile(response):
+    sampler = g.pop('profile_sampler', None)
+    if sampler is None:
+        return response
+    sampler.stop()
+    wall_started, cpu_started = g.profile_started
+    wall = time.perf_counter() - wall_started
+    cpu = time.thread_time() - cpu_started
+
+    # Spread measured wall time over phases in proportion to their samples
+    per_sample = wall / sampler.samples if sampler.samples else 0
+    phases = {phase: round(count * per_sample * 1000, 2) for phase, count in sampler.phases.most_common()}
+    profile_id = f"{int(time.time() * 1000)}-{threading.get_ident() % 10000}"
+    recent_profiles.append({
+        'id': profile_id,
+        'path': request.full_path.rstrip('?'),
+        'status': response.status_code,
+        'startedAt': datetime.now(timezone.utc).isoformat(),
+        'wallMs': round(wall * 1000, 2),
+        'cpuMs': round(cpu * 1000, 2),
+        'ioMs': round(sum(ms for phase, ms in phases.items() if phase in PROFILE_IO_PHASES), 2),
+        'dynamodbMs': round(g.get('dynamodb_seconds', 0.0) * 1000, 2),
+        'dynamodbCalls': g.get('dynamodb_calls', 0),
+        'samples': sampler.samples,
+        'phasesMs': phases,
+        'stacks': sampler.stacks
+    })
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+# ============================================
+# BACKGROUND WORKERS
+# ============================================
+
+_background_workers_started = False
+_background_workers_lock = threading.Lock()
+
+def start_background_workers():
+    """Start the background refresh threads once per process"""
+    global _background_workers_started
+    with _background_workers_lock:
+        if _background_workers_started:
+            return
+        _background_workers_started = True
+
+    insights_view.start()
+    if os.getenv('CACHE_WARMING_ENABLED', 'True').lower() == 'true':
+        cache_warmer.start()
+
+@app.before_request
+def ensure_background_workers():
+    # Started lazily so the reloader parent and plain imports stay idle
+    if os.getenv('BACKGROUND_WORKERS_ENABLED', 'True').lower() == 'true':
+        start_background_workers()
+
 # ============================================
 # API ENDPOINTS
 # ============================================
@@ -259,6 +1804,7 @@ def health_check():
 
 # done
 @app.route('/api/dashboard_stats', methods=['GET'])
+@cached_response(ttl=0, devices=('esp32-ultrasonic', 'esp32-light', 'esp32-camera'), hours='24')
 def get_dashboard_stats():
     """Get main dashboard statistics"""
     hours = int(request.args.get('hours', 24))
@@ -273,7 +1819,7 @@ def get_dashboard_stats():
             'ScanIndexForward': True,
         }
         while True:
-            response = presence_table.query(**query_kwargs)
+            response = query_table(presence_table, **query_kwargs)
             # print(response)
             items.extend(response.get('Items', []))
 
@@ -305,23 +1851,11 @@ def get_dashboard_stats():
         focus_score = calculate_focus_score(sessions, 8)
         
         # Get current sensor status
-        latest_presence = presence_table.query(
-            KeyConditionExpression=Key('deviceId').eq('esp32-ultrasonic'),
-            ScanIndexForward=False,
-            Limit=1
-        )
+        latest_presence = latest_reading(presence_table, 'esp32-ultrasonic')
 
-        latest_ambience = ambient_table.query(
-            KeyConditionExpression=Key('deviceId').eq('esp32-light'),
-            ScanIndexForward=False,
-            Limit=1
-        )
+        latest_ambience = latest_reading(ambient_table, 'esp32-light')
 
-        latest_camera = stress_table.query(
-            KeyConditionExpression=Key('deviceId').eq('esp32-camera'),
-            ScanIndexForward=False,
-            Limit=1
-        )
+        latest_camera = latest_reading(stress_table, 'esp32-camera')
 
         raw_light = latest_ambience['Items'][0].get('ambientLux') if latest_ambience.get('Items') else None
         light_level = sanitize_light_level(raw_light)
@@ -346,6 +1880,7 @@ def get_dashboard_stats():
 
 # done
 @app.route('/api/productivity', methods=['GET'])
+@cached_response(deviceId='esp32-ultrasonic', days='7')
 def get_productivity():
     """Get productivity data by time of day"""
     device_id = request.args.get('deviceId', 'esp32-ultrasonic')
@@ -357,33 +1892,20 @@ def get_productivity():
             day: {hour: {'total': 0, 'present': 0} for hour in range(24)} for day in range(7)
         }
         
-        cutoff_dt = datetime.now(timezone.utc) - timedelta(days=days)
+        now = datetime.now(timezone.utc)
+        cutoff_dt = now - timedelta(days=days)
         cutoff_iso_string = cutoff_dt.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        now_iso = now.strftime('%Y-%m-%dT%H:%M:%S.999Z')
         
-        response = presence_table.query(
-            KeyConditionExpression=Key('deviceId').eq(device_id) & Key('timestamp').gte(cutoff_iso_string)
-        )
+        intervals = presence_intervals(device_id, cutoff_iso_string, now_iso)
         
-        items = decimal_to_float(response.get('Items', []))
-        
-        for item in items:
-            try:
-                timestamp = item.get('timestamp', '')
-                if timestamp:
-                    dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                    hour = dt.hour
-                    sgt_zone = timezone(timedelta(hours=8))
-                    dt_sgt = dt.astimezone(sgt_zone)
-                    
-                    # Extract Day and Hour
-                    day_idx = dt_sgt.weekday() # 0=Mon, 6=Sun
-                    hour = dt_sgt.hour         # 0-23
-                    
-                    weekly_stats[day_idx][hour]['total'] += 1
-                    if item.get('presence', False):
-                        weekly_stats[day_idx][hour]['present'] += 1
-            except:
-                continue
+        for dt_sgt, counts in hourly_presence_counts(intervals, timedelta(hours=8)).items():
+            # Extract Day and Hour
+            day_idx = dt_sgt.weekday() # 0=Mon, 6=Sun
+            hour = dt_sgt.hour         # 0-23
+            
+            weekly_stats[day_idx][hour]['total'] += counts['total']
+            weekly_stats[day_idx][hour]['present'] += counts['present']
         
         # Calculate productivity percentage for each hour
         days_map = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
@@ -413,66 +1935,37 @@ def get_productivity():
 # done
 @app.route('/api/insights', methods=['GET'])
 def get_insights():
-    """Get smart insights based on sensor data"""
+    """Get smart insights based on sensor data (served from the precomputed view)"""
+    device_id = request.args.get('deviceId', 'esp32-ultrasonic')
     try:
-        # Get recent sensor data
-        hours = 24
-        cutoff_dt = datetime.now(timezone.utc) - timedelta(hours=hours)
-        cutoff_iso_string = cutoff_dt.strftime('%Y-%m-%dT%H:%M:%S.000Z')
-        
-        response = presence_table.query(
-            KeyConditionExpression=Key('deviceId').eq("esp32-ultrasonic") & Key('timestamp').gte(cutoff_iso_string)
-        )
-        
-        items = decimal_to_float(response.get('Items', []))
-        sessions = calculate_sessions(items)
-        
-        # Get latest sensor reading
-        latest_presence = presence_table.query(
-            KeyConditionExpression=Key('deviceId').eq('esp32-ultrasonic'),
-            ScanIndexForward=False,
-            Limit=1
-        )
-
-        latest_ambience = ambient_table.query(
-            KeyConditionExpression=Key('deviceId').eq('esp32-light'),
-            ScanIndexForward=False,
-            Limit=1
-        )
-
-        latest_camera = stress_table.query(
-            KeyConditionExpression=Key('deviceId').eq('esp32-camera'),
-            ScanIndexForward=False,
-            Limit=1
-        )
-
-        raw_light = latest_ambience['Items'][0].get('ambientLux') if latest_ambience.get('Items') else None
-        light_level = sanitize_light_level(raw_light)
-        
-        presence_detected = latest_presence['Items'][0].get('presence', False) if latest_presence.get('Items') else False
-        stress_level = latest_camera['Items'][0].get('stressScore', 0.0) if latest_camera.get('Items') else 0.0
+        if not insights_view.serves(device_id):
+            # Not in INSIGHTS_DEVICES: compute inline without adding it to the refresh loop
+            entry = insights_view.compute(device_id)
+        else:
+            entry = insights_view.get(device_id)
+            if entry is None:
+                # Cold view (first request for this device): compute inline once
+                entry = insights_view.refresh(device_id)
+            elif not insights_view.running() or time.time() - entry['computedAtUnix'] >= insights_view.max_age:
+                # No refresh thread (e.g. Lambda) or it fell behind: check freshness inline
+                entry = insights_view.refresh_if_stale(device_id)
 
-        sensor_data = {
-            'lightLevel': light_level,  # Can be None
-            'lightSensorConnected': light_level is not None,
-            'presenceDetected': presence_detected,
-            'stressLevel': stress_level
-        }
-        
-        # Get study trends for insights
-        study_trends_response = get_study_trends_internal(7)
-        # print(sensor_data, study_trends_response)
+        return jsonify({
+            'insights': entry['insights'],
+            'computedAt': entry['computedAt'],
+            'ageSeconds': round(time.time() - entry['computedAtUnix'], 1)
+        })
 
-        insights = generate_insights(sensor_data, sessions, study_trends_response.get('trends', []))
-        print(insights)
-        
-        return jsonify({'insights': insights})
-        
+    except CapacityExhausted as e:
+        response = jsonify({"error": str(e), "insights": []})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"error": str(e), "insights": []})
 
-def get_study_trends_internal(days):
+def get_study_trends_internal(days, device_id='esp32-ultrasonic'):
     """Internal function to get study trends"""
     try:
         trends = []
@@ -487,13 +1980,7 @@ def get_study_trends_internal(days):
             start_iso = start_of_day.strftime('%Y-%m-%dT%H:%M:%S.000Z')
             end_iso = end_of_day.strftime('%Y-%m-%dT%H:%M:%S.999Z')
             
-            response = presence_table.query(
-                KeyConditionExpression=Key('deviceId').eq('esp32-ultrasonic') & 
-                    Key('timestamp').between(start_iso, end_iso)
-            )
-            
-            items = decimal_to_float(response.get('Items', []))
-            sessions = calculate_sessions(items)
+            sessions = day_sessions(device_id, start_iso, end_iso)
             
             total_study_minutes = sum(s.get('duration_minutes', 0) for s in sessions)
             study_hours = round(total_study_minutes / 60, 1)
@@ -508,32 +1995,25 @@ def get_study_trends_internal(days):
             })
         
         return {'trends': trends}
-    except:
+    except CapacityExhausted:
+        # Let the caller keep its previous result instead of one built from no trends
+        raise
+    except Exception as e:
+        print(f"Error in get_study_trends_internal: {e}")
         return {'trends': []}
 
 # done
 @app.route('/api/sensors/latest', methods=['GET'])
+@cached_response(ttl=0, devices=('esp32-ultrasonic', 'esp32-light', 'esp32-camera'))
 def get_latest_sensor_data():
     """Get the most recent readings from all sensors"""
     try:
         # Get latest presence data
-        latest_presence = presence_table.query(
-            KeyConditionExpression=Key('deviceId').eq('esp32-ultrasonic'),
-            ScanIndexForward=False,
-            Limit=1
-        )
+        latest_presence = latest_reading(presence_table, 'esp32-ultrasonic')
 
-        latest_ambience = ambient_table.query(
-            KeyConditionExpression=Key('deviceId').eq('esp32-light'),
-            ScanIndexForward=False,
-            Limit=1
-        )
+        latest_ambience = latest_reading(ambient_table, 'esp32-light')
 
-        latest_camera = stress_table.query(
-            KeyConditionExpression=Key('deviceId').eq('esp32-camera'),
-            ScanIndexForward=False,
-            Limit=1
-        )
+        latest_camera = latest_reading(stress_table, 'esp32-camera')
 
         raw_light = latest_ambience['Items'][0].get('ambientLux') if latest_ambience.get('Items') else None
         light_level = sanitize_light_level(raw_light)
@@ -556,7 +2036,25 @@ def get_latest_sensor_data():
         print(f"Error fetching latest sensor data: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/sensors/health', methods=['GET'])
+def get_sensor_health():
+    """Fleet heartbeat status answered from the in-memory index"""
+    devices = heartbeat_index.snapshot()
+    flagged = [d for d in devices if d['status'] != 'online' or not d['cadenceOk']]
+    return jsonify({
+        'devices': devices,
+        'summary': {
+            'total': len(devices),
+            'online': sum(1 for d in devices if d['status'] == 'online'),
+            'flagged': len(flagged),
+            'cadenceSeconds': heartbeat_index.cadence,
+            'toleranceBeats': heartbeat_index.tolerance_beats
+        },
+        'generatedAt': datetime.now(timezone.utc).isoformat()
+    })
+
 @app.route('/api/study_trends', methods=['GET'])
+@cached_response(deviceId='esp32-ultrasonic', days='7')
 def get_study_trends():
     """Get study patterns - hourly for day view, daily for week/month view"""
     device_id = request.args.get('deviceId', 'esp32-ultrasonic')
@@ -589,13 +2087,7 @@ def get_study_trends():
             start_iso = start_of_day_utc.strftime('%Y-%m-%dT%H:%M:%S.000Z')
             end_iso = end_of_day_utc.strftime('%Y-%m-%dT%H:%M:%S.999Z')
             
-            response = presence_table.query(
-                KeyConditionExpression=Key('deviceId').eq(device_id) & 
-                    Key('timestamp').between(start_iso, end_iso)
-            )
-            
-            items = decimal_to_float(response.get('Items', []))
-            sessions = calculate_sessions(items)
+            sessions = day_sessions(device_id, start_iso, end_iso)
             
             total_study_minutes = sum(s.get('duration_minutes', 0) for s in sessions)
             study_hours = round(total_study_minutes / 60, 1)
@@ -649,12 +2141,9 @@ def get_hourly_trends(device_id, sgt_offset):
         
         start_of_day_utc = start_of_day_sgt - sgt_offset
         start_iso = start_of_day_utc.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        now_iso = now_utc.strftime('%Y-%m-%dT%H:%M:%S.999Z')
         
-        response = presence_table.query(
-            KeyConditionExpression=Key('deviceId').eq(device_id) & Key('timestamp').gte(start_iso)
-        )
-        
-        items = decimal_to_float(response.get('Items', []))
+        intervals = presence_intervals(device_id, start_iso, now_iso)
         
         hourly_data = {}
         for hour in range(24):
@@ -665,21 +2154,11 @@ def get_hourly_trends(device_id, sgt_offset):
                 'study_minutes': 0
             }
         
-        for item in items:
-            try:
-                timestamp = item.get('timestamp', '')
-                if timestamp:
-                    dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                    dt_sgt = dt + sgt_offset
-                    hour = dt_sgt.hour
-                    
-                    hourly_data[hour]['total_readings'] += 1
-                    if item.get('presence', False):
-                        hourly_data[hour]['present_readings'] += 1
-            except:
-                continue
+        for dt_sgt, counts in hourly_presence_counts(intervals, sgt_offset).items():
+            hourly_data[dt_sgt.hour]['total_readings'] += counts['total']
+            hourly_data[dt_sgt.hour]['present_readings'] += counts['present']
         
-        sessions = calculate_sessions(items)
+        sessions = calculate_sessions_from_intervals(intervals)
         
         for session in sessions:
             try:
@@ -766,6 +2245,7 @@ def get_hourly_trends(device_id, sgt_offset):
         return jsonify({"error": str(e)}), 500
 # done
 @app.route('/api/stress_history', methods=['GET'])
+@cached_response(deviceId='esp32-camera', hours='6')
 def get_stress_history():
     """Get stress level history for the current session"""
     device_id = request.args.get('deviceId', 'esp32-camera')
@@ -775,7 +2255,8 @@ def get_stress_history():
         cutoff_dt = datetime.now(timezone.utc) - timedelta(hours=hours)
         cutoff_iso_string = cutoff_dt.strftime('%Y-%m-%dT%H:%M:%S.000Z')
         
-        response = stress_table.query(
+        response = query_table(
+            stress_table,
             KeyConditionExpression=Key('deviceId').eq(device_id) & Key('timestamp').gte(cutoff_iso_string)
         )
         
@@ -855,6 +2336,7 @@ def get_stress_history():
 
 # done
 @app.route('/api/presence_history', methods=['GET'])
+@cached_response(devices=('esp32-ultrasonic',), deviceId='esp32-ultrasonic', hours='24')
 def get_presence_history():
     """Get presence history and calculated sessions"""
     now = datetime.now(timezone.utc)
@@ -865,16 +2347,13 @@ def get_presence_history():
     cutoff_iso_string = cutoff_utc.strftime('%Y-%m-%dT%H:%M:%S.000Z')
 
     try:
-        response = presence_table.query(
-            KeyConditionExpression=Key('deviceId').eq('esp32-ultrasonic') & Key('timestamp').gte(cutoff_iso_string)
-        )
-        items = response.get('Items', [])
-        items = decimal_to_float(items)
+        now_iso = now.strftime('%Y-%m-%dT%H:%M:%S.999Z')
+        intervals = presence_intervals('esp32-ultrasonic', cutoff_iso_string, now_iso)
         
-        calculated_sessions = calculate_sessions(items)
+        calculated_sessions = calculate_sessions_from_intervals(intervals)
 
         return jsonify({
-            "count": len(items),
+            "count": sum(int(i['readings']) for i in intervals),
             "sessions": calculated_sessions,
             "totalStudyMinutes": sum(s.get('duration_minutes', 0) for s in calculated_sessions)
         })
@@ -883,6 +2362,455 @@ def get_presence_history():
         print(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """Invalidate cached data after new readings are ingested (called by the ingest path)"""
+    # Bumps shared generation counters, so it is gated like ingest
+    denied = ingest_access_error()
+    if denied:
+        return denied
+    payload = request.get_json(silent=True) or {}
+    device_id = payload.get('deviceId') or request.args.get('deviceId')
+    # Optional epoch seconds of the ingested readings; backfilled ones also drop closed-day sessions
+    try:
+        epochs = [float(e) for e in payload.get('epochs') or ()]
+    except (TypeError, ValueError):
+        return jsonify({"error": "epochs must be a list of epoch seconds"}), 400
+    invalidate_on_ingest(device_id, epochs)
+    return jsonify({'invalidated': True, 'deviceId': device_id})
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Response cache, request coalescing and warmer counters"""
+    return jsonify({
+        'cache': response_cache.stats(),
+        'coalescing': single_flight.stats(),
+        'warmer': cache_warmer.stats(),
+        'knownDevices': {kind: devices_of_kind(kind) for kind in known_devices}
+    })
+
+@app.route('/api/capacity/stats', methods=['GET'])
+def get_capacity_stats():
+    """DynamoDB read capacity consumption per endpoint and budget state"""
+    with _capacity_stats_lock:
+        endpoints = {scope: dict(stats) for scope, stats in capacity_stats.items()}
+    return jsonify({
+        'budget': {
+            'unitsPerSecond': read_budget.units_per_second,
+            'burst': read_budget.burst,
+            'available': read_budget.available()
+        },
+        'endpoints': endpoints
+    })
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """Summaries of recently captured request profiles, newest first"""
+    return jsonify({'profiles': [
+        {k: v for k, v in profile.items() if k != 'stacks'} for profile in reversed(recent_profiles)
+    ]})
+
+@app.route('/api/profiles/<profile_id>.folded', methods=['GET'])
+def download_profile(profile_id):
+    """Collapsed stacks of one profile, ready for flamegraph.pl / speedscope"""
+    for profile in list(recent_profiles):
+        if profile['id'] == profile_id:
+            body = ''.join(f"{stack} {count}\n" for stack, count in profile['stacks'].most_common())
+            response = app.response_class(body, mimetype='text/plain')
+            response.headers['Content-Disposition'] = f'attachment; filename="profile-{profile_id}.folded"'
+            return response
+    abort(404)
+
+# ============================================
+# INGEST
+# ============================================
+
+# Writes are opt-in and need the shared secret in the X-Ingest-Token header
+INGEST_ENABLED = os.getenv('INGEST_ENABLED', 'False').lower() == 'true'
+INGEST_TOKEN = os.getenv('INGEST_TOKEN', '')
+
+def ingest_access_error():
+    """Error response for a write request that is not allowed, else None"""
+    if not INGEST_ENABLED:
+        return jsonify({"error": "Ingest is disabled (set INGEST_ENABLED=True)"}), 404
+    if not INGEST_TOKEN:
+        return jsonify({"error": "Ingest requires INGEST_TOKEN to be configured"}), 403
+    if not hmac.compare_digest(request.headers.get('X-Ingest-Token', ''), INGEST_TOKEN):
+        return jsonify({"error": "Missing or invalid X-Ingest-Token"}), 401
+    return None
+
+# Firmware MQTT field names -> table attribute names
+INGEST_FIELDS = {
+    'distance_cm': 'distanceCm', 'distanceCm': 'distanceCm',
+    'ambient_lux': 'ambientLux', 'ambientLux': 'ambientLux',
+    'presence': 'presence', 'stressScore': 'stressScore', 'primaryEmotion': 'primaryEmotion',
+}
+
+def ingest_item(default_device, message, received_at):
+    """Turn a firmware MQTT message (or a table-shaped reading) into a table item"""
+    device_id = message.get('deviceId') or message.get('device') or default_device
+    # Firmware `timestamp` is millis() uptime, so readings are stamped on arrival
+    epoch = float(message['unixTimestamp']) if message.get('unixTimestamp') else received_at
+    item = {
+        'deviceId': device_id,
+        'timestamp': to_iso_timestamp(epoch),
+        'unixTimestamp': Decimal(int(epoch)),
+    }
+    for field, attribute in INGEST_FIELDS.items():
+        value = message.get(field)
+        if value is None:
+            continue
+        item[attribute] = Decimal(str(value)) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+    return item
+
+@app.route('/api/ingest/<name>', methods=['POST'])
+def ingest_readings(name):
+    """Write one reading or a list of readings, then refresh heartbeats and caches"""
+    denied = ingest_access_error()
+    if denied:
+        return denied
+    if name not in SENSOR_TABLES:
+        return jsonify({"error": f"Unknown table '{name}', expected one of {sorted(SENSOR_TABLES)}"}), 404
+    table, default_device, _ = SENSOR_TABLES[name]
+    payload = request.get_json(silent=True)
+    messages = payload if isinstance(payload, list) else [payload] if isinstance(payload, dict) else None
+    if not messages or not all(isinstance(message, dict) for message in messages):
+        return jsonify({"error": "Expected a JSON object or a non-empty list of objects"}), 400
+
+    received_at = time.time()
+    # Readings stamped on arrival are spread 1 ms apart so each keeps its own (deviceId, timestamp) key
+    try:
+        items = [ingest_item(default_device, message, received_at + i * 0.001) for i, message in enumerate(messages)]
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid reading: {e}"}), 400
+    keys = set((item['deviceId'], item['timestamp']) for item in items)
+    if len(keys) != len(items):
+        return jsonify({"error": "Batch contains readings with the same deviceId and timestamp"}), 400
+    try:
+        with table.batch_writer() as batch:
+            for item in items:
+                batch.put_item(Item=item)
+    except Exception as e:
+        print(f"Error ingesting {name}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    by_device = {}
+    for item in items:
+        by_device.setdefault(item['deviceId'], []).append(float(item['unixTimestamp']))
+    for device_id, epochs in by_device.items():
+        kind = TABLE_KINDS[table.name]
+        heartbeat_index.observe(kind, device_id, sorted(epochs), checked_at=time.time())
+        if kind in known_devices:
+            remember_device(kind, device_id)
+        invalidate_on_ingest(device_id, epochs)
+
+    sent = [float(m['sentAt']) for m in messages if isinstance(m, dict) and m.get('sentAt')]
+    return jsonify({
+        'ingested': len(items),
+        'receivedAt': received_at,
+        'lagMs': round((received_at - min(sent)) * 1000, 1) if sent else None
+    })
+
+# ============================================
+# BULK EXPORT
+# ============================================
+
+@app.route('/api/export/<name>', methods=['GET'])
+def export_readings(name):
+    """Stream raw readings for a device and time range as NDJSON or CSV.
+
+    Query args: deviceId, start, end (ISO-8601 or epoch seconds; default
+    last 24h), format=ndjson|csv, header=0 to omit the CSV header, gzip=1,
+    pageSize, and token to resume after the row a continuation token was
+    built from.
+    """
+    if name not in SENSOR_TABLES:
+        return jsonify({"error": f"Unknown table '{name}', expected one of {sorted(SENSOR_TABLES)}"}), 404
+    table, default_device, columns = SENSOR_TABLES[name]
+    device_id = request.args.get('deviceId', default_device)
+    export_format = request.args.get('format', 'ndjson')
+    compress = request.args.get('gzip') in ('1', 'true')
+    request_header = request.args.get('header', '1') != '0'
+
+    try:
+        now = datetime.now(timezone.utc)
+        end_iso = to_iso_timestamp(request.args.get('end', now.isoformat()))
+        start_iso = to_iso_timestamp(request.args.get('start', (now - timedelta(hours=24)).isoformat()))
+        token = request.args.get('token')
+        start_key = decode_continuation_token(token) if token else None
+        page_size = int(request.args.get('pageSize', 1000))
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({"error": f"Invalid export arguments: {e}"}), 400
+    if not 1 <= page_size <= 5000:
+        return jsonify({"error": "pageSize must be between 1 and 5000"}), 400
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+    if start_key and start_key['deviceId'] != device_id:
+        return jsonify({"error": "Continuation token belongs to another device"}), 400
+    if table is presence_table:
+        try:
+            horizon = raw_presence_horizon(device_id)
+        except Exception as e:
+            print(f"Error in export: {e}")
+            return jsonify({"error": str(e)}), 500
+        resume_iso = max(start_iso, start_key['timestamp']) if start_key else start_iso
+        if horizon and resume_iso < to_iso_timestamp(horizon):
+            return jsonify({"error": f"Raw presence rows before {to_iso_timestamp(horizon)} were compacted "
+                                     "into presence intervals and expired; start the export at or after it"}), 400
+
+    def generate_chunks():
+        buffer = io.StringIO()
+        writer = None
+        if export_format == 'csv':
+            writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore', lineterminator='\n')
+            if request_header:
+                writer.writeheader()
+        rows = 0
+        for item in iter_readings(table, device_id, start_iso, end_iso, page_size, start_key):
+            if writer:
+                writer.writerow(item)
+            else:
+                buffer.write(json.dumps(item, separators=(',', ':')) + '\n')
+            rows += 1
+            # Flush once per page so memory stays bounded by page_size
+            if rows % page_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    def encode(chunks):
+        if not compress:
+            for chunk in chunks:
+                yield chunk.encode('utf-8')
+            return
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+        for chunk in chunks:
+            # Sync flush keeps every chunk decodable if the connection drops
+            yield compressor.compress(chunk.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+    # gzip=1 delivers a .gz file (application/gzip, no Content-Encoding) so
+    # HTTP clients do not transparently decode it under a .gz name
+    if compress:
+        mimetype = 'application/gzip'
+    else:
+        mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+    response = Response(stream_with_context(encode(generate_chunks())), mimetype=mimetype)
+    filename = f"{name}-{device_id}.{export_format}{'.gz' if compress else ''}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Export-Range'] = f"{start_iso}/{end_iso}"
+    return response
+
+# ============================================
+# SESSION THRESHOLD SWEEP
+# ============================================
+
+SWEEP_MAX_DAYS = int(os.getenv('SWEEP_MAX_DAYS', 366))
+
+@app.route('/api/sessions/sweep', methods=['GET'])
+@cached_response(deviceId='esp32-ultrasonic', days='30', thresholds='60,300,900')
+def get_session_sweep():
+    """Compare session detection across timeout thresholds over one window"""
+    device_id = request.args.get('deviceId', 'esp32-ultrasonic')
+
+    try:
+        days = int(request.args.get('days', 30))
+    except ValueError:
+        return jsonify({"error": "days must be an integer"}), 400
+    if not 1 <= days <= SWEEP_MAX_DAYS:
+        return jsonify({"error": f"days must be between 1 and {SWEEP_MAX_DAYS}"}), 400
+    try:
+        thresholds = sorted({int(t) for t in request.args.get('thresholds', '60,300,900').split(',') if t.strip()})
+    except ValueError:
+        return jsonify({"error": "thresholds must be a comma-separated list of seconds"}), 400
+    if not thresholds or len(thresholds) > 200:
+        return jsonify({"error": "Provide between 1 and 200 thresholds"}), 400
+    if thresholds[0] < PRESENCE_INTERVAL_MAX_GAP_SECONDS:
+        return jsonify({"error": f"Thresholds must be at least {PRESENCE_INTERVAL_MAX_GAP_SECONDS:g} seconds "
+                                 "(the gap that splits presence intervals)"}), 400
+
+    try:
+        now = datetime.now(timezone.utc)
+        start_iso = to_iso_timestamp((now - timedelta(days=days)).isoformat())
+        end_iso = to_iso_timestamp(now.isoformat())
+
+        intervals = presence_intervals(device_id, start_iso, end_iso)
+
+        return jsonify({
+            'deviceId': device_id,
+            'days': days,
+            'readings': sum(int(i['readings']) for i in intervals),
+            'activeReadings': sum(int(i['readings']) for i in intervals if i.get('presence') is True),
+            'sweep': sweep_session_intervals(intervals, thresholds, 8 * days)
+        })
+
+    except Exception as e:
+        print(f"Error in session sweep: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# ============================================
+# SENSOR FUSION
+# ============================================
+
+def fuse_readings(presence, ambient, stress, tolerance):
+    """Merge-join three timestamp-sorted streams onto the presence readings.
+
+    Each presence reading is paired with the nearest ambient and stress
+    reading within `tolerance` seconds on either side. Rows are held only
+    until the merged stream moves `tolerance` past them, so memory stays
+    bounded by the tolerance window rather than the range.
+    """
+    def tagged(stream, source):
+        for item in stream:
+            yield reading_epoch(item), source, item
+
+    merged = heapq.merge(tagged(presence, 'presence'), tagged(ambient, 'ambient'), tagged(stress, 'stress'),
+                         key=lambda entry: entry[0])
+    pending = deque()
+    last = {'ambient': None, 'stress': None}
+
+    def offer(row, source, t, item):
+        gap = abs(t - row['t'])
+        if gap <= tolerance and (row[source] is None or gap < row[source + 'Gap']):
+            row[source], row[source + 'Gap'] = item, gap
+
+    for t, source, item in merged:
+        while pending and pending[0]['t'] + tolerance < t:
+            yield pending.popleft()
+        if source == 'presence':
+            row = {'t': t, 'presence': item, 'ambient': None, 'ambientGap': None, 'stress': None, 'stressGap': None}
+            # Readings just before this one may be the nearest match
+            for other in ('ambient', 'stress'):
+                if last[other] is not None:
+                    offer(row, other, *last[other])
+            pending.append(row)
+        else:
+            last[source] = (t, item)
+            for row in pending:
+                offer(row, source, t, item)
+    while pending:
+        yield pending.popleft()
+
+def fused_row(row):
+    presence, ambient, stress = row['presence'], row['ambient'], row['stress']
+    return {
+        'timestamp': presence.get('timestamp'),
+        'presence': presence.get('presence') is True,
+        'distanceCm': presence.get('distanceCm'),
+        'lightLevel': sanitize_light_level(ambient.get('ambientLux')) if ambient else None,
+        'stressLevel': round(float(stress.get('stressScore', 0)) * 100, 1) if stress else None,
+        'emotionState': stress.get('primaryEmotion') if stress else None,
+    }
+
+class _RunningMean:
+    __slots__ = ('count', 'total')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        if value is not None:
+            self.count += 1
+            self.total += value
+
+    def value(self):
+        return round(self.total / self.count, 1) if self.count else None
+
+FUSION_MAX_TOLERANCE_SECONDS = float(os.getenv('FUSION_MAX_TOLERANCE_SECONDS', 300))
+
+@app.route('/api/fusion', methods=['GET'])
+@cached_response(hours='24', toleranceSeconds='10', rows='0', presenceDeviceId='esp32-ultrasonic',
+                 ambientDeviceId='esp32-light', cameraDeviceId='esp32-camera')
+def get_sensor_fusion():
+    """Time-aligned presence/light/stress rows and cross-sensor aggregates"""
+    presence_device = request.args.get('presenceDeviceId', 'esp32-ultrasonic')
+    ambient_device = request.args.get('ambientDeviceId', 'esp32-light')
+    camera_device = request.args.get('cameraDeviceId', 'esp32-camera')
+    try:
+        hours = int(request.args.get('hours', 24))
+        tolerance = float(request.args.get('toleranceSeconds', 10))
+        max_rows = min(int(request.args.get('rows', 0)), 5000)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid fusion arguments: {e}"}), 400
+    # Rows wait in memory for `tolerance` seconds of stream, so it bounds the join's working set
+    if not 0 <= tolerance <= FUSION_MAX_TOLERANCE_SECONDS:
+        return jsonify({"error": f"toleranceSeconds must be between 0 and {FUSION_MAX_TOLERANCE_SECONDS:g}"}), 400
+
+    try:
+        now = datetime.now(timezone.utc)
+        start_iso = to_iso_timestamp((now - timedelta(hours=hours)).isoformat())
+        end_iso = to_iso_timestamp(now.isoformat())
+        horizon = raw_presence_horizon(presence_device)
+        if horizon and start_iso < to_iso_timestamp(horizon):
+            return jsonify({"error": f"Raw presence rows before {to_iso_timestamp(horizon)} were compacted "
+                                     "into presence intervals and expired; request a shorter range"}), 400
+
+        fused = fuse_readings(
+            iter_readings(presence_table, presence_device, start_iso, end_iso),
+            iter_readings(ambient_table, ambient_device, start_iso, end_iso),
+            iter_readings(stress_table, camera_device, start_iso, end_iso),
+            tolerance
+        )
+
+        bands = {}
+        by_presence = {True: {'rows': 0, 'lux': _RunningMean(), 'stress': _RunningMean()},
+                       False: {'rows': 0, 'lux': _RunningMean(), 'stress': _RunningMean()}}
+        rows, sample = 0, []
+        with_light = with_stress = 0
+
+        for row in fused:
+            data = fused_row(row)
+            rows += 1
+            light, stress_level, present = data['lightLevel'], data['stressLevel'], data['presence']
+            with_light += light is not None
+            with_stress += stress_level is not None
+
+            band_name = get_light_quality(light)['status']
+            band = bands.setdefault(band_name, {'rows': 0, 'present': 0, 'stress': _RunningMean(), 'presentStress': _RunningMean()})
+            band['rows'] += 1
+            band['present'] += present
+            band['stress'].add(stress_level)
+            if present:
+                band['presentStress'].add(stress_level)
+
+            group = by_presence[present]
+            group['rows'] += 1
+            group['lux'].add(light)
+            group['stress'].add(stress_level)
+
+            if len(sample) < max_rows:
+                sample.append(data)
+
+        light_bands = [{
+            'band': name,
+            'rows': band['rows'],
+            'presenceRatio': round(band['present'] / band['rows'] * 100) if band['rows'] else 0,
+            'averageStress': band['stress'].value(),
+            'averageStressWhilePresent': band['presentStress'].value(),
+        } for name, band in sorted(bands.items(), key=lambda entry: -entry[1]['rows'])]
+
+        return jsonify({
+            'range': {'start': start_iso, 'end': end_iso},
+            'toleranceSeconds': tolerance,
+            'coverage': {'rows': rows, 'withLight': with_light, 'withStress': with_stress},
+            'byLightBand': light_bands,
+            'presentVsAbsent': {
+                ('present' if key else 'absent'): {
+                    'rows': group['rows'],
+                    'averageLightLevel': group['lux'].value(),
+                    'averageStress': group['stress'].value(),
+                } for key, group in by_presence.items()
+            },
+            'rows': sample
+        })
+
+    except Exception as e:
+        print(f"Error in sensor fusion: {e}")
+        return jsonify({"error": str(e)}), 500
+
 # ============================================
 # WEBSOCKET ENDPOINTS INFO
 # ============================================
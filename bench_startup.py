@@ -0,0 +1,62 @@
+"""Cold-start benchmark: lazy app/lambda_handler import vs eager client setup.
+
+Each sample runs in a fresh interpreter so module caches are cold. The
+'eager' mode imports app and then forces what the module used to do at
+import time (import boto3, build the resource, bind the three tables),
+which is the baseline the lazy modes are compared against.
+
+Usage: python bench_startup.py [--runs 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+MODES = {
+    'lazy-import': 'import app',
+    'lambda-handler-import': 'import lambda_handler',
+    'eager-import': (
+        'import app\n'
+        'for t in (app.presence_table, app.ambient_table, app.stress_table): t.resolve()'
+    ),
+}
+
+PROBE = '''
+import time
+_t0 = time.perf_counter()
+{body}
+print((time.perf_counter() - _t0) * 1000)
+'''
+
+def time_mode(body, runs):
+    env = dict(os.environ)
+    # Resource construction needs a region and credentials but never calls AWS
+    env.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    env.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    env['BACKGROUND_WORKERS_ENABLED'] = 'False'
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, '-c', PROBE.format(body=body)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env, capture_output=True, text=True, check=True
+        )
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=15)
+    args = parser.parse_args()
+
+    results = {mode: time_mode(body, args.runs) for mode, body in MODES.items()}
+    baseline = statistics.median(results['eager-import'])
+
+    print(f"{'mode':<24}{'min ms':>10}{'median ms':>12}{'max ms':>10}{'vs eager':>10}")
+    for mode, samples in results.items():
+        median = statistics.median(samples)
+        print(f"{mode:<24}{min(samples):>10.1f}{median:>12.1f}{max(samples):>10.1f}{median / baseline:>9.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""Compact raw presence readings into the PresenceIntervals tier.
+
+Turns closed hours of ProximitySensorData into run-length intervals
+(start, end, presence, reading count, min/max distance) and then deletes
+raw rows that are older than the retention period and already compacted.
+Run it from cron or a scheduled Lambda; reruns are idempotent. The API
+reads intervals once PRESENCE_INTERVALS_ENABLED=True; until then raw rows
+are always kept, because the API still reads them.
+
+Usage:
+    python compact_presence.py --retention-days 30
+    python compact_presence.py esp32-ultrasonic --retention-days -1   # keep raw rows
+"""
+import argparse
+import os
+
+from app import RAW_RETENTION_DAYS, compact_presence
+
+def main():
+    parser = argparse.ArgumentParser(description='Compact presence readings into state intervals')
+    parser.add_argument('devices', nargs='*', help='presence deviceIds (default: PRESENCE_DEVICES)')
+    parser.add_argument('--retention-days', type=float, default=RAW_RETENTION_DAYS,
+                        help='delete compacted raw rows older than this (negative keeps them)')
+    args = parser.parse_args()
+
+    devices = args.devices or [d for d in os.getenv('PRESENCE_DEVICES', 'esp32-ultrasonic').split(',') if d]
+    for device_id in devices:
+        result = compact_presence(device_id, retention_days=args.retention_days)
+        ratio = result['readingsCompacted'] / result['intervalsWritten'] if result['intervalsWritten'] else 0
+        print(f"{device_id}: {result['readingsCompacted']} readings -> {result['intervalsWritten']} intervals "
+              f"({ratio:.0f}x), compacted through {result['compactedThrough']}, "
+              f"deleted {result['rawDeleted']} raw rows (raw retention {result['rawRetention']})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Command-line client for /api/export: stream sensor readings to a file.
+
+Writes only complete rows. If the connection drops, it reconnects with a
+continuation token built from the last row written, so a long export
+resumes where it stopped instead of starting over. Memory use does not
+depend on the size of the range.
+
+Usage:
+    python export_readings.py presence --start 2025-01-01 --end 2025-03-31 \
+        --format csv --gzip -o presence.csv
+"""
+import argparse
+import base64
+import csv
+import json
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+
+CHUNK_BYTES = 64 * 1024
+
+def encode_continuation_token(key):
+    """Resume token for the row after `key`; same encoding as app.encode_continuation_token"""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def stream_lines(response, compressed):
+    """Yield complete text lines from a (possibly gzip) streaming response"""
+    decompressor = zlib.decompressobj(31) if compressed else None
+    pending = b''
+    while True:
+        chunk = response.read1(CHUNK_BYTES) if hasattr(response, 'read1') else response.read(CHUNK_BYTES)
+        if not chunk:
+            break
+        if decompressor:
+            chunk = decompressor.decompress(chunk)
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield line.decode('utf-8') + '\n'
+
+def row_key(line, export_format, header):
+    """(deviceId, timestamp) of an exported line, used to build the resume token"""
+    if export_format == 'ndjson':
+        item = json.loads(line)
+        return {'deviceId': item['deviceId'], 'timestamp': item['timestamp']}
+    values = next(csv.reader([line]))
+    return {'deviceId': values[header.index('deviceId')], 'timestamp': values[header.index('timestamp')]}
+
+def export(args, out):
+    params = {'format': args.format, 'pageSize': args.page_size}
+    for name, value in (('deviceId', args.device), ('start', args.start), ('end', args.end)):
+        if value:
+            params[name] = value
+    if args.gzip:
+        params['gzip'] = '1'
+
+    token, rows, attempts = args.token, 0, 0
+    # A resumed export appends to a file that already has its CSV header
+    header_written = bool(args.token)
+    while True:
+        query = dict(params, token=token) if token else params
+        url = f"{args.url.rstrip('/')}/api/export/{args.table}?{urllib.parse.urlencode(query)}"
+        try:
+            with urllib.request.urlopen(url, timeout=args.timeout) as response:
+                header = None
+                for line in stream_lines(response, args.gzip):
+                    if args.format == 'csv' and header is None:
+                        header = next(csv.reader([line]))
+                        if not header_written:
+                            out.write(line)
+                            header_written = True
+                        continue
+                    out.write(line)
+                    rows += 1
+                    token = encode_continuation_token(row_key(line, args.format, header))
+            return rows
+        except urllib.error.HTTPError as e:
+            if e.code < 500 and e.code != 429:
+                raise SystemExit(f"export failed: {e.code} {e.read().decode('utf-8', 'replace')}")
+            error = e
+        except (urllib.error.URLError, OSError, zlib.error) as e:
+            error = e
+
+        attempts += 1
+        if attempts > args.retries:
+            raise SystemExit(f"export failed after {attempts} attempts: {error} (resume with --token {token})")
+        print(f"connection lost after {rows} rows ({error}); resuming", file=sys.stderr)
+        time.sleep(min(2 ** attempts, 30))
+
+def main():
+    parser = argparse.ArgumentParser(description='Export raw sensor readings from the dashboard backend')
+    parser.add_argument('table', choices=('presence', 'ambient', 'stress'))
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--device', help='deviceId (defaults to the table\'s usual device)')
+    parser.add_argument('--start', help='ISO-8601 or epoch seconds (default: 24h ago)')
+    parser.add_argument('--end', help='ISO-8601 or epoch seconds (default: now)')
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    parser.add_argument('--gzip', action='store_true', help='compress on the wire')
+    parser.add_argument('--token', help='continuation token to resume a previous export')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--retries', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, 'a' if args.token else 'w', encoding='utf-8', newline='') as out:
+            rows = export(args, out)
+    else:
+        rows = export(args, sys.stdout)
+    print(f"exported {rows} rows", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""AWS Lambda entry point for the study dashboard API.
+
+Wraps the Flask app from app.py for API Gateway (REST v1 and HTTP API v2
+payloads). app.py defers boto3 until the first DynamoDB query, and the
+resource it builds is kept at module level so warm invocations reuse it.
+
+Handler setting: lambda_handler.handler
+"""
+import base64
+import os
+
+# Background refresh threads do not survive between Lambda invocations
+os.environ.setdefault('BACKGROUND_WORKERS_ENABLED', 'False')
+
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+from app import app
+
+TEXT_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+def event_to_environ(event):
+    """Build a WSGI environ from an API Gateway proxy event"""
+    headers = {k: v for k, v in (event.get('headers') or {}).items() if v is not None}
+
+    if event.get('version') == '2.0':
+        http = event['requestContext']['http']
+        method = http['method']
+        path = event.get('rawPath', '/')
+        query_string = event.get('rawQueryString', '')
+        if event.get('cookies'):
+            headers['Cookie'] = '; '.join(event['cookies'])
+    else:
+        method = event.get('httpMethod', 'GET')
+        path = event.get('path', '/')
+        multi = event.get('multiValueQueryStringParameters')
+        single = event.get('queryStringParameters') or {}
+        query_string = [(k, v) for k, values in multi.items() for v in values] if multi else list(single.items())
+
+    body = event.get('body') or b''
+    if event.get('isBase64Encoded') and body:
+        body = base64.b64decode(body)
+    elif isinstance(body, str):
+        body = body.encode('utf-8')
+
+    builder = EnvironBuilder(path=path, method=method, query_string=query_string, headers=headers, data=body)
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+def handler(event, context):
+    """Lambda handler: run one request through the Flask app"""
+    environ = event_to_environ(event)
+    app_iter, status, headers = run_wsgi_app(app, environ, buffered=True)
+    try:
+        body = b''.join(app_iter)
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+    content_type = headers.get('Content-Type', '')
+    is_text = not headers.get('Content-Encoding') and content_type.startswith(TEXT_MIMETYPES)
+
+    return {
+        'statusCode': int(status.split(' ', 1)[0]),
+        'headers': dict(headers.items()),
+        'multiValueHeaders': {k: headers.getlist(k) for k in headers.keys()},
+        'isBase64Encoded': not is_text,
+        'body': body.decode('utf-8') if is_text else base64.b64encode(body).decode('ascii'),
+    }
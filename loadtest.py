@@ -0,0 +1,164 @@
+"""Load generator that simulates many open dashboards against app.py.
+
+Each simulated client repeats the seven-request fan-out of
+StudyDashboard.jsx fetchAllData every --refresh seconds, firing the
+requests concurrently like Promise.all does. By default the backend runs
+in-process on a threaded server over local_dynamo seeded with --days of
+5-second readings, which also allows counting DynamoDB calls per refresh.
+Pass --url to target a server that is already running (the DynamoDB
+columns are then omitted).
+
+Usage:
+    python loadtest.py --clients 50 --refresh 10 --duration 60 --view mixed
+"""
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Mirrors fetchAllData: (endpoint, day params, week params)
+FAN_OUT = [
+    ('/api/dashboard_stats', '', ''),
+    ('/api/productivity', '?days=1', '?days=7'),
+    ('/api/insights', '', ''),
+    ('/api/sensors/latest', '', ''),
+    ('/api/study_trends', '?days=1', '?days=7'),
+    ('/api/stress_history', '?hours=6', '?hours=24'),
+    ('/api/presence_history', '?hours=24', '?hours=168'),
+]
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[idx]
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {endpoint: [] for endpoint, _, _ in FAN_OUT}
+        self.errors = {endpoint: 0 for endpoint, _, _ in FAN_OUT}
+        self.refreshes = 0
+        self.refresh_latencies = []
+        self._lock = threading.Lock()
+
+    def request(self, endpoint, seconds, ok):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def refresh(self, seconds):
+        with self._lock:
+            self.refreshes += 1
+            self.refresh_latencies.append(seconds)
+
+def fetch(base_url, endpoint, params, recorder, timeout):
+    started = time.perf_counter()
+    ok = True
+    try:
+        with urllib.request.urlopen(base_url + endpoint + params, timeout=timeout) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    recorder.request(endpoint, time.perf_counter() - started, ok)
+
+def run_client(base_url, view, refresh, deadline, pool, recorder, timeout):
+    # Stagger start so clients do not all refresh on the same tick
+    time.sleep(random.uniform(0, refresh))
+    while time.time() < deadline:
+        started = time.perf_counter()
+        current = view if view != 'mixed' else random.choice(('day', 'week'))
+        futures = [
+            pool.submit(fetch, base_url, endpoint, day if current == 'day' else week, recorder, timeout)
+            for endpoint, day, week in FAN_OUT
+        ]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - started
+        recorder.refresh(elapsed)
+        time.sleep(max(0.0, refresh - elapsed))
+
+def start_local_backend(days, latency, port):
+    """Run app.py over a seeded local_dynamo on a threaded werkzeug server"""
+    os.environ['DYNAMODB_BACKEND'] = 'local'
+    os.environ.setdefault('BACKGROUND_WORKERS_ENABLED', 'True')
+    import app
+    import local_dynamo
+    from werkzeug.serving import make_server
+
+    db = local_dynamo.LocalDynamoDB(latency=latency)
+    counts = local_dynamo.seed_local_dynamodb(db, days=days)
+    app.configure_dynamodb(db)
+
+    server = make_server('127.0.0.1', port, app.app, threaded=True)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+    return server, db, counts
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate concurrent dashboards running fetchAllData')
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--refresh', type=float, default=10.0, help='seconds between refreshes (REFRESH_INTERVAL)')
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--view', choices=('day', 'week', 'mixed'), default='mixed')
+    parser.add_argument('--url', help='target an existing backend instead of an in-process one')
+    parser.add_argument('--days', type=int, default=8, help='days of readings to seed the local stand-in with')
+    parser.add_argument('--latency', type=float, default=0.005, help='simulated DynamoDB round trip (seconds)')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    db = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        server, db, counts = start_local_backend(args.days, args.latency, args.port)
+        base_url = f'http://127.0.0.1:{args.port}'
+        print('seeded local DynamoDB: ' + ', '.join(f'{k}={v}' for k, v in counts.items()))
+
+    recorder = Recorder()
+    calls_before = db.total_calls() if db else 0
+    started = time.time()
+    deadline = started + args.duration
+    with ThreadPoolExecutor(max_workers=args.clients * len(FAN_OUT)) as pool:
+        clients = [
+            threading.Thread(target=run_client, args=(base_url, args.view, args.refresh, deadline, pool, recorder, args.timeout))
+            for _ in range(args.clients)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+    wall = time.time() - started
+
+    total_requests = sum(len(v) for v in recorder.latencies.values())
+    total_errors = sum(recorder.errors.values())
+    print(f'\nclients={args.clients} refresh={args.refresh}s view={args.view} wall={wall:.1f}s')
+    print(f'requests={total_requests} errors={total_errors} throughput={total_requests / wall:.1f} req/s '
+          f'refreshes={recorder.refreshes} ({recorder.refreshes / wall:.2f}/s)')
+    print(f'refresh latency p50={percentile(recorder.refresh_latencies, 50) * 1000:.0f}ms '
+          f'p95={percentile(recorder.refresh_latencies, 95) * 1000:.0f}ms '
+          f'p99={percentile(recorder.refresh_latencies, 99) * 1000:.0f}ms')
+
+    print(f"\n{'endpoint':<26}{'count':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for endpoint, samples in recorder.latencies.items():
+        print(f'{endpoint:<26}{len(samples):>7}{recorder.errors[endpoint]:>8}'
+              f'{percentile(samples, 50) * 1000:>9.1f}{percentile(samples, 95) * 1000:>9.1f}'
+              f'{percentile(samples, 99) * 1000:>9.1f}{(max(samples) if samples else 0) * 1000:>9.1f}')
+
+    if db is not None:
+        calls = db.total_calls() - calls_before
+        per_refresh = calls / recorder.refreshes if recorder.refreshes else 0
+        print(f'\nDynamoDB queries={calls} per dashboard refresh={per_refresh:.2f} '
+              f'(includes background warming/insights refresh)')
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""In-memory stand-in for the DynamoDB tables used by app.py.
+
+Implements the subset of the boto3 Table API the backend calls (query with
+key conditions, pagination, ScanIndexForward, Limit, ExclusiveStartKey and
+ReturnConsumedCapacity, plus put_item/delete_item/batch_writer) on
+partition-sorted lists, so it can hold months of 5-second readings.
+
+It can inject throttling errors, either at a fixed rate, for the next N
+calls, or by enforcing a provisioned read capacity. That makes the backoff
+and degraded paths in app.py testable without AWS:
+
+    import app, local_dynamo
+    db = local_dynamo.LocalDynamoDB()
+    app.configure_dynamodb(db)
+    db.Table('ProximitySensorData').inject_throttling(rate=0.3)
+"""
+import bisect
+import math
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+TABLE_NAMES = ('ProximitySensorData', 'AmbientSensorData', 'FaceDetections')
+PAGE_SIZE_BYTES = 1024 * 1024  # DynamoDB stops a query page at 1 MB
+
+def item_size(item):
+    """Approximate DynamoDB item size in bytes (attribute names + values)"""
+    return sum(len(str(k)) + len(str(v)) for k, v in item.items())
+
+def evaluate_key_condition(condition, hash_key):
+    """Split a boto3 key condition into (hash value, range predicate bounds).
+
+    Returns (hash_value, low, high, low_inclusive, high_inclusive) where a
+    bound of None is open.
+    """
+    hash_value = None
+    low = high = None
+    low_inc = high_inc = True
+    pending = [condition]
+    while pending:
+        expr = pending.pop().get_expression()
+        operator, values = expr['operator'], expr['values']
+        if operator == 'AND':
+            pending.extend(values)
+        elif operator == '=' and values[0].name == hash_key:
+            hash_value = values[1]
+        elif operator == '=':
+            low = high = values[1]
+        elif operator == 'BETWEEN':
+            low, high = values[1], values[2]
+        elif operator in ('>', '>='):
+            low, low_inc = values[1], operator == '>='
+        elif operator in ('<', '<='):
+            high, high_inc = values[1], operator == '<='
+        elif operator == 'begins_with':
+            low, high = values[1], values[1] + '\uffff'
+        else:
+            raise ValueError(f"Unsupported key condition operator: {operator}")
+    return hash_value, low, high, low_inc, high_inc
+
+class LocalTable:
+    """One table keyed by a hash key and a string/number range key"""
+
+    def __init__(self, name, hash_key='deviceId', range_key='timestamp', read_capacity=None, latency=0.0):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.latency = latency
+        self.calls = 0
+        self.throttled = 0
+        self._partitions = {}  # hash value -> (sorted range keys, items)
+        self._lock = threading.Lock()
+        self._throttle_rate = 0.0
+        self._throttle_next = 0
+        self._read_capacity = read_capacity
+        self._tokens = float(read_capacity or 0)
+        self._refilled_at = time.monotonic()
+
+    # -- throttling injection --
+
+    def inject_throttling(self, rate=0.0, next_calls=0, read_capacity=None):
+        """Throttle a fraction of calls, the next N calls, and/or above an RCU/s limit"""
+        with self._lock:
+            self._throttle_rate = rate
+            self._throttle_next = next_calls
+            self._read_capacity = read_capacity
+            self._tokens = float(read_capacity or 0)
+            self._refilled_at = time.monotonic()
+
+    def _check_throttle(self):
+        with self._lock:
+            throttle = False
+            if self._throttle_next > 0:
+                self._throttle_next -= 1
+                throttle = True
+            elif self._throttle_rate and random.random() < self._throttle_rate:
+                throttle = True
+            elif self._read_capacity:
+                now = time.monotonic()
+                self._tokens = min(self._read_capacity, self._tokens + (now - self._refilled_at) * self._read_capacity)
+                self._refilled_at = now
+                throttle = self._tokens <= 0
+            if throttle:
+                self.throttled += 1
+        if throttle:
+            raise ClientError(
+                {'Error': {'Code': 'ProvisionedThroughputExceededException',
+                           'Message': 'The level of configured provisioned throughput for the table was exceeded.'}},
+                'Query'
+            )
+
+    def _charge(self, units):
+        if self._read_capacity:
+            with self._lock:
+                self._tokens -= units
+
+    # -- writes --
+
+    def put_item(self, Item, **kwargs):
+        hash_value, range_value = Item[self.hash_key], Item[self.range_key]
+        with self._lock:
+            keys, items = self._partitions.setdefault(hash_value, ([], []))
+            idx = bisect.bisect_left(keys, range_value)
+            if idx < len(keys) and keys[idx] == range_value:
+                items[idx] = Item
+            else:
+                keys.insert(idx, range_value)
+                items.insert(idx, Item)
+        return {}
+
+    def load(self, items):
+        """Bulk insert items (much faster than put_item for seeding)"""
+        with self._lock:
+            for item in items:
+                keys, rows = self._partitions.setdefault(item[self.hash_key], ([], []))
+                keys.append(item[self.range_key])
+                rows.append(item)
+            for hash_value, (keys, rows) in self._partitions.items():
+                order = sorted(range(len(keys)), key=keys.__getitem__)
+                self._partitions[hash_value] = ([keys[i] for i in order], [rows[i] for i in order])
+
+    def delete_item(self, Key, **kwargs):
+        with self._lock:
+            keys, items = self._partitions.get(Key[self.hash_key], ([], []))
+            idx = bisect.bisect_left(keys, Key[self.range_key])
+            if idx < len(keys) and keys[idx] == Key[self.range_key]:
+                del keys[idx]
+                del items[idx]
+        return {}
+
+    def batch_writer(self, **kwargs):
+        return _BatchWriter(self)
+
+    def item_count(self):
+        with self._lock:
+            return sum(len(keys) for keys, _ in self._partitions.values())
+
+    # -- reads --
+
+    def query(self, KeyConditionExpression, ScanIndexForward=True, Limit=None,
+              ExclusiveStartKey=None, ReturnConsumedCapacity=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        self._check_throttle()
+
+        hash_value, low, high, low_inc, high_inc = evaluate_key_condition(KeyConditionExpression, self.hash_key)
+        with self._lock:
+            keys, items = self._partitions.get(hash_value, ([], []))
+            start = 0 if low is None else (bisect.bisect_left if low_inc else bisect.bisect_right)(keys, low)
+            end = len(keys) if high is None else (bisect.bisect_right if high_inc else bisect.bisect_left)(keys, high)
+
+            if ExclusiveStartKey is not None:
+                last = ExclusiveStartKey[self.range_key]
+                if ScanIndexForward:
+                    start = max(start, bisect.bisect_right(keys, last))
+                else:
+                    end = min(end, bisect.bisect_left(keys, last))
+
+            indices = range(start, end) if ScanIndexForward else range(end - 1, start - 1, -1)
+            page, size = [], 0
+            truncated = False
+            for i in indices:
+                if (Limit is not None and len(page) >= Limit) or size >= PAGE_SIZE_BYTES:
+                    truncated = True
+                    break
+                page.append(items[i])
+                size += item_size(items[i])
+
+        units = max(math.ceil(size / 4096), 1) * 0.5  # eventually consistent read
+        self._charge(units)
+
+        response = {'Items': page, 'Count': len(page), 'ScannedCount': len(page)}
+        if truncated and page:
+            response['LastEvaluatedKey'] = {self.hash_key: hash_value, self.range_key: page[-1][self.range_key]}
+        if ReturnConsumedCapacity in ('TOTAL', 'INDEXES'):
+            response['ConsumedCapacity'] = {'TableName': self.name, 'CapacityUnits': units}
+        return response
+
+class _BatchWriter:
+    def __init__(self, table):
+        self._table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def put_item(self, Item):
+        self._table.put_item(Item=Item)
+
+    def delete_item(self, Key):
+        self._table.delete_item(Key=Key)
+
+class LocalDynamoDB:
+    """Drop-in for boto3.resource('dynamodb') exposing Table(name)"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def Table(self, name):
+        with self._lock:
+            if name not in self._tables:
+                self._tables[name] = LocalTable(name, latency=self.latency)
+            return self._tables[name]
+
+    def total_calls(self):
+        with self._lock:
+            return sum(t.calls for t in self._tables.values())
+
+def iso_timestamp(unix_seconds):
+    """Format epoch seconds the way the ingest Lambdas store `timestamp`"""
+    return datetime.fromtimestamp(unix_seconds, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+def generate_readings(days=8, interval=5, camera_interval=30, end=None, seed=7):
+    """Synthetic presence/ambient/camera items shaped like the real tables.
+
+    Presence follows study blocks of 25-90 minutes separated by breaks, with
+    nights mostly empty; light follows the day with desk-lamp plateaus.
+    Returns (presence_items, ambient_items, camera_items).
+    """
+    rng = random.Random(seed)
+    end = int(end or time.time())
+    start = end - days * 86400
+    presence, ambient, camera = [], [], []
+    present = False
+    state_until = start
+    for t in range(start - start % interval, end, interval):
+        if t >= state_until:
+            hour_sgt = (t // 3600 + 8) % 24
+            daytime = 8 <= hour_sgt < 23
+            present = daytime and rng.random() < (0.7 if not present else 0.2)
+            state_until = t + rng.randint(25, 90) * 60 if present else t + rng.randint(5, 40) * 60
+        ts = iso_timestamp(t)
+        distance = rng.uniform(35, 70) if present else rng.uniform(150, 400)
+        presence.append({
+            'deviceId': 'esp32-ultrasonic', 'timestamp': ts, 'unixTimestamp': Decimal(t),
+            'presence': present, 'distanceCm': Decimal(str(round(distance, 1)))
+        })
+        hour_sgt = (t // 3600 + 8) % 24
+        lux = 50 + (400 if present else 0) + (250 if 9 <= hour_sgt < 18 else 0) + rng.uniform(-40, 40)
+        ambient.append({
+            'deviceId': 'esp32-light', 'timestamp': ts, 'unixTimestamp': Decimal(t),
+            'ambientLux': Decimal(str(round(lux, 1)))
+        })
+        if present and t % camera_interval == 0:
+            stress = min(max(rng.gauss(0.35, 0.15), 0), 1)
+            camera.append({
+                'deviceId': 'esp32-camera', 'timestamp': ts, 'unixTimestamp': Decimal(t),
+                'stressScore': Decimal(str(round(stress, 3))),
+                'primaryEmotion': rng.choice(['calm', 'calm', 'happy', 'neutral', 'sad', 'angry'])
+            })
+    return presence, ambient, camera
+
+def seed_local_dynamodb(db, days=8, **kwargs):
+    """Fill a LocalDynamoDB with generate_readings() output; returns item counts"""
+    presence, ambient, camera = generate_readings(days=days, **kwargs)
+    db.Table('ProximitySensorData').load(presence)
+    db.Table('AmbientSensorData').load(ambient)
+    db.Table('FaceDetections').load(camera)
+    return {'ProximitySensorData': len(presence), 'AmbientSensorData': len(ambient), 'FaceDetections': len(camera)}
@@ -0,0 +1,265 @@
+"""Replay recorded sensor readings at 1x-1000x speed.
+
+Reads exports of the three tables (NDJSON or CSV as written by
+export_readings.py, optionally .gz). The streams are merged by time and
+re-emitted on the original schedule, compressed by --speed. Readings go
+either to MQTT in the firmware's JSON shape or to the backend's
+/api/ingest endpoints. Input is streamed, so recordings of any length
+replay in constant memory.
+
+Every --report-every seconds it prints throughput and two lags:
+- schedule lag: how far sends trail their scheduled time. It grows once
+  the sender saturates.
+- end-to-end lag: send until the target acknowledged the message. That
+  is the HTTP response for ingest, or the PUBACK at QoS 1 for MQTT.
+
+The ingest target must run with INGEST_ENABLED=True and INGEST_TOKEN set;
+pass the same secret with --token (or INGEST_TOKEN). Point that backend at
+replay tables (PRESENCE_TABLE, AMBIENT_TABLE, STRESS_TABLE) rather than
+the production ones.
+
+Usage:
+    INGEST_TOKEN=... python replay_sensors.py --presence presence.ndjson --ambient ambient.ndjson \
+        --speed 100 --ingest http://localhost:5000
+    python replay_sensors.py --presence presence.csv.gz --speed 10 --mqtt broker.local:1883
+"""
+import argparse
+import csv
+import gzip
+import heapq
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+# Presence and ambient use the firmware topics (arduino_code/esp32.ino). The
+# camera firmware publishes images to esp32/camera/pub, which recordings of
+# processed detections cannot reproduce, so stress readings go to a
+# detections topic of our own (--stress-topic).
+MQTT_TOPICS = {
+    'presence': 'esp32/presence/pub',
+    'ambient': 'esp32/ambient/pub',
+    'stress': 'esp32/camera/detections',
+}
+
+def open_text(path):
+    return gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz') else open(path, encoding='utf-8')
+
+def read_recording(path):
+    """Yield readings from an NDJSON or CSV export in file order"""
+    with open_text(path) as f:
+        if '.csv' in path:
+            for row in csv.DictReader(f):
+                yield {k: v for k, v in row.items() if v != ''}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def reading_epoch(item):
+    if item.get('unixTimestamp'):
+        return float(item['unixTimestamp'])
+    return datetime.fromisoformat(item['timestamp'].replace('Z', '+00:00')).timestamp()
+
+def as_number(value):
+    return float(value) if isinstance(value, str) else value
+
+def firmware_message(kind, item, uptime_ms):
+    """Shape a stored reading like the ESP32 publishes it"""
+    if kind == 'presence':
+        presence = item.get('presence')
+        return {'device': item['deviceId'], 'distance_cm': as_number(item.get('distanceCm', 0)),
+                'presence': presence in (True, 'True', 'true', '1'), 'timestamp': uptime_ms}
+    if kind == 'ambient':
+        return {'device': item['deviceId'], 'ambient_lux': as_number(item.get('ambientLux', 0)), 'timestamp': uptime_ms}
+    return {'device': item['deviceId'], 'stressScore': as_number(item.get('stressScore', 0)),
+            'primaryEmotion': item.get('primaryEmotion'), 'timestamp': uptime_ms}
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.acked = 0
+        self.errors = 0
+        self.schedule_lag = []
+        self.e2e_lag = []
+        self._lock = threading.Lock()
+
+    def record(self, count, schedule_lag, e2e_lag, ok):
+        with self._lock:
+            self.sent += count
+            if ok:
+                self.acked += count
+                self.e2e_lag.append(e2e_lag)
+            else:
+                self.errors += count
+            self.schedule_lag.append(schedule_lag)
+
+    def drain(self):
+        with self._lock:
+            snapshot = (self.sent, self.acked, self.errors, self.schedule_lag, self.e2e_lag)
+            self.schedule_lag, self.e2e_lag = [], []
+            return snapshot
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+class IngestSink:
+    def __init__(self, base_url, timeout, token):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.token = token
+
+    def send(self, kind, messages):
+        request = urllib.request.Request(
+            f'{self.base_url}/api/ingest/{kind}',
+            data=json.dumps(messages).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'X-Ingest-Token': self.token},
+            method='POST'
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+            return response.status == 200
+
+class MqttSink:
+    def __init__(self, address, timeout, topics):
+        try:
+            import paho.mqtt.client as mqtt
+        except ImportError:
+            raise SystemExit('MQTT output needs the paho-mqtt package (pip install paho-mqtt)')
+        host, _, port = address.partition(':')
+        self.timeout = timeout
+        self.topics = topics
+        self.client = mqtt.Client()
+        self.client.connect(host, int(port or 1883))
+        self.client.loop_start()
+
+    def send(self, kind, messages):
+        infos = [self.client.publish(self.topics[kind], json.dumps(m), qos=1) for m in messages]
+        for info in infos:
+            info.wait_for_publish(self.timeout)
+        return all(info.is_published() for info in infos)
+
+class NullSink:
+    def send(self, kind, messages):
+        return True
+
+def sender(sink, work, stats):
+    while True:
+        job = work.get()
+        if job is None:
+            return
+        kind, messages, scheduled = job
+        sent_at = time.time()
+        for message in messages:
+            message['sentAt'] = sent_at
+        try:
+            ok = sink.send(kind, messages)
+        except Exception as e:
+            print(f'send failed: {e}', file=sys.stderr)
+            ok = False
+        stats.record(len(messages), sent_at - scheduled, time.time() - sent_at, ok)
+
+def reporter(stats, interval, stop):
+    last_sent, last_time = 0, time.time()
+    while not stop.wait(interval):
+        sent, acked, errors, schedule_lag, e2e_lag = stats.drain()
+        now = time.time()
+        rate = (sent - last_sent) / (now - last_time)
+        last_sent, last_time = sent, now
+        print(f'sent={sent} acked={acked} errors={errors} rate={rate:.0f} msg/s '
+              f'schedule lag p50={percentile(schedule_lag, 50) * 1000:.0f}ms p99={percentile(schedule_lag, 99) * 1000:.0f}ms '
+              f'e2e p50={percentile(e2e_lag, 50) * 1000:.0f}ms p99={percentile(e2e_lag, 99) * 1000:.0f}ms')
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded sensor readings at accelerated speed')
+    parser.add_argument('--presence', help='ProximitySensorData export (.ndjson/.csv[.gz])')
+    parser.add_argument('--ambient', help='AmbientSensorData export')
+    parser.add_argument('--stress', help='FaceDetections export')
+    parser.add_argument('--speed', type=float, default=1.0, help='1 to 1000 times real time')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--ingest', metavar='URL', help='POST to the backend /api/ingest/<table>')
+    target.add_argument('--mqtt', metavar='HOST[:PORT]', help='publish firmware-shaped JSON')
+    target.add_argument('--dry-run', action='store_true', help='measure the replay loop alone')
+    parser.add_argument('--keep-timestamps', action='store_true',
+                        help='send the recorded unixTimestamp (backfill) instead of letting ingest stamp arrival time')
+    parser.add_argument('--stress-topic', default=MQTT_TOPICS['stress'],
+                        help='MQTT topic for stress detections (not a firmware topic: the camera publishes '
+                             'images to esp32/camera/pub, which recordings cannot reproduce)')
+    parser.add_argument('--token', default=os.getenv('INGEST_TOKEN', ''),
+                        help='shared secret for /api/ingest (default: $INGEST_TOKEN)')
+    parser.add_argument('--batch', type=int, default=1, help='readings per ingest request')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent senders')
+    parser.add_argument('--report-every', type=float, default=5.0)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    args = parser.parse_args()
+
+    if not 1 <= args.speed <= 1000:
+        parser.error('--speed must be between 1 and 1000')
+    sources = [(kind, path) for kind, path in (('presence', args.presence), ('ambient', args.ambient), ('stress', args.stress)) if path]
+    if not sources:
+        parser.error('give at least one of --presence, --ambient, --stress')
+
+    if args.ingest:
+        if not args.token:
+            parser.error('--ingest needs --token or INGEST_TOKEN')
+        sink = IngestSink(args.ingest, args.timeout, args.token)
+    elif args.mqtt:
+        sink = MqttSink(args.mqtt, args.timeout, dict(MQTT_TOPICS, stress=args.stress_topic))
+    else:
+        sink = NullSink()
+
+    def tagged(kind, path):
+        for item in read_recording(path):
+            yield reading_epoch(item), kind, item
+
+    stream = heapq.merge(*(tagged(kind, path) for kind, path in sources), key=lambda entry: entry[0])
+
+    stats = Stats()
+    work = queue.Queue(maxsize=args.workers * 4)  # bounded: a slow target shows up as schedule lag
+    senders = [threading.Thread(target=sender, args=(sink, work, stats), daemon=True) for _ in range(args.workers)]
+    for thread in senders:
+        thread.start()
+    stop = threading.Event()
+    threading.Thread(target=reporter, args=(stats, args.report_every, stop), daemon=True).start()
+
+    started = time.time()
+    first_epoch = None
+    pending = {}
+    for epoch, kind, item in stream:
+        if first_epoch is None:
+            first_epoch = epoch
+        scheduled = started + (epoch - first_epoch) / args.speed
+        delay = scheduled - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        message = firmware_message(kind, item, int((scheduled - started) * 1000))
+        if args.keep_timestamps:
+            message['unixTimestamp'] = epoch
+        batch = pending.setdefault(kind, [])
+        batch.append(message)
+        if len(batch) >= args.batch:
+            work.put((kind, batch, scheduled))
+            pending[kind] = []
+    for kind, batch in pending.items():
+        if batch:
+            work.put((kind, batch, time.time()))
+    for _ in senders:
+        work.put(None)
+    for thread in senders:
+        thread.join()
+    stop.set()
+
+    wall = time.time() - started
+    sent, acked, errors, schedule_lag, e2e_lag = stats.drain()
+    print(f'\ndone: {sent} readings in {wall:.1f}s ({sent / wall:.0f} msg/s at {args.speed:g}x), '
+          f'acked={acked} errors={errors}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# app.py reads these at import time: use the in-memory tables and no background threads
+os.environ.setdefault('DYNAMODB_BACKEND', 'local')
+os.environ.setdefault('BACKGROUND_WORKERS_ENABLED', 'False')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
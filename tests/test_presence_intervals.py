@@ -0,0 +1,116 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import app
+import local_dynamo
+
+DEVICE = 'esp32-ultrasonic'
+SGT = timedelta(hours=8)
+
+def random_readings(seed, count=5000):
+    """Presence readings with 5 s cadence, random flips and occasional outages"""
+    rng = random.Random(seed)
+    t = 1_700_000_000 + rng.randint(0, 3600)
+    present = rng.random() < 0.5
+    items = []
+    for _ in range(count):
+        if rng.random() < 0.02:
+            present = not present
+        items.append({
+            'deviceId': DEVICE,
+            'timestamp': local_dynamo.iso_timestamp(t),
+            'unixTimestamp': t,
+            'presence': present,
+            'distanceCm': round(rng.uniform(30, 400), 1),
+        })
+        roll = rng.random()
+        t += rng.choice((60, 300, 1200, 5000)) if roll < 0.01 else rng.randint(16, 40) if roll < 0.03 else 5
+    return items
+
+def hourly_by_reading(items, offset):
+    buckets = {}
+    for item in items:
+        hour = datetime.fromtimestamp(item['unixTimestamp'] // 3600 * 3600, tz=timezone.utc) + offset
+        counts = buckets.setdefault(hour, {'total': 0, 'present': 0})
+        counts['total'] += 1
+        counts['present'] += item['presence'] is True
+    return buckets
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('threshold', [15, 60, 900])
+def test_sessions_from_intervals_match_raw_readings(seed, threshold):
+    items = random_readings(seed)
+    intervals = app.compact_presence_intervals(items)
+
+    assert len(intervals) < len(items)
+    assert app.calculate_sessions_from_intervals(intervals, threshold) == app.calculate_sessions(items, threshold)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_hourly_counts_from_intervals_match_raw_readings(seed):
+    items = random_readings(seed)
+    intervals = app.compact_presence_intervals(items)
+
+    assert app.hourly_presence_counts(intervals, SGT) == hourly_by_reading(items, SGT)
+
+def test_intervals_keep_reading_counts_and_distance_range():
+    items = random_readings(7)
+    intervals = app.compact_presence_intervals(items)
+
+    assert sum(i['readings'] for i in intervals) == len(items)
+    first = [item for item in items if item['unixTimestamp'] <= intervals[0]['endUnix']]
+    assert intervals[0]['minDistanceCm'] == min(item['distanceCm'] for item in first)
+    assert intervals[0]['maxDistanceCm'] == max(item['distanceCm'] for item in first)
+
+@pytest.fixture
+def db(monkeypatch):
+    resource = local_dynamo.LocalDynamoDB()
+    local_dynamo.seed_local_dynamodb(resource, days=3)
+    app.configure_dynamodb(resource)
+    monkeypatch.setattr(app.cache_store, 'backend', app.MemoryCacheBackend())
+    monkeypatch.setattr(app, 'read_budget', app.ReadCapacityBudget(0))
+    return resource
+
+def window():
+    now = time.time()
+    start = app.to_iso_timestamp(app.floor_hour(now - 3 * 86400))
+    end = app.to_iso_timestamp(now)
+    return start, end
+
+def test_compaction_round_trip_with_retention(db, monkeypatch):
+    monkeypatch.setattr(app, 'PRESENCE_INTERVALS_ENABLED', True)
+    raw_table = db.Table('ProximitySensorData')
+    start, end = window()
+    raw_sessions = app.calculate_sessions(list(app.iter_readings(app.presence_table, DEVICE, start, end)))
+    raw_before = raw_table.item_count()
+
+    now = time.time()
+    result = app.compact_presence(DEVICE, now=now, retention_days=1)
+
+    cutoff = app.floor_hour(now - 86400)
+    assert result['rawRetention'] == 'enforced'
+    assert result['rawDeleted'] > 0
+    assert raw_table.item_count() == raw_before - result['rawDeleted']
+    remaining = list(app.iter_readings(app.presence_table, DEVICE, '1970-01-01T00:00:00.000Z', end))
+    assert min(app.reading_epoch(item) for item in remaining) >= cutoff
+    # Old hours now come only from the compact tier, yet sessions are unchanged
+    assert app.calculate_sessions_from_intervals(app.presence_intervals(DEVICE, start, end)) == raw_sessions
+    assert app.raw_presence_horizon(DEVICE) == cutoff
+
+    intervals = db.Table('PresenceIntervals').item_count()
+    rerun = app.compact_presence(DEVICE, now=now, retention_days=1)
+    assert rerun['rawDeleted'] == 0
+    assert db.Table('PresenceIntervals').item_count() == intervals
+
+def test_compaction_keeps_raw_rows_while_tier_is_disabled(db, monkeypatch):
+    monkeypatch.setattr(app, 'PRESENCE_INTERVALS_ENABLED', False)
+    raw_before = db.Table('ProximitySensorData').item_count()
+
+    result = app.compact_presence(DEVICE, retention_days=0)
+
+    assert result['rawDeleted'] == 0
+    assert result['rawRetention'] == 'kept'
+    assert result['intervalsWritten'] > 0
+    assert db.Table('ProximitySensorData').item_count() == raw_before
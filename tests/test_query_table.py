@@ -0,0 +1,85 @@
+import pytest
+
+import app
+import local_dynamo
+
+DEVICE = 'esp32-ultrasonic'
+
+@pytest.fixture
+def db(monkeypatch):
+    """Fresh seeded local tables, a fresh cache and no backoff sleeps"""
+    resource = local_dynamo.LocalDynamoDB()
+    local_dynamo.seed_local_dynamodb(resource, days=1)
+    app.configure_dynamodb(resource)
+    monkeypatch.setattr(app.cache_store, 'backend', app.MemoryCacheBackend())
+    monkeypatch.setattr(app, 'read_budget', app.ReadCapacityBudget(0))
+    monkeypatch.setattr(app, 'QUERY_BACKOFF_BASE', 0.0)
+    return resource
+
+def latest(table):
+    return app.query_table(table, KeyConditionExpression=app.Key('deviceId').eq(DEVICE),
+                           ScanIndexForward=False, Limit=1)
+
+def test_retries_through_transient_throttling(db):
+    table = db.Table('ProximitySensorData')
+    table.inject_throttling(next_calls=app.QUERY_MAX_RETRIES)
+
+    response = latest(app.presence_table)
+
+    assert len(response['Items']) == 1
+    assert table.calls == app.QUERY_MAX_RETRIES + 1
+    assert table.throttled == app.QUERY_MAX_RETRIES
+
+def test_gives_up_after_max_retries(db):
+    table = db.Table('ProximitySensorData')
+    table.inject_throttling(rate=1.0)
+
+    with pytest.raises(app.CapacityExhausted):
+        latest(app.presence_table)
+    assert table.calls == app.QUERY_MAX_RETRIES + 1
+
+def test_non_throttling_errors_are_not_retried(db, monkeypatch):
+    table = db.Table('ProximitySensorData')
+    calls = []
+
+    def broken_query(**kwargs):
+        calls.append(kwargs)
+        raise ValueError('bad request')
+
+    monkeypatch.setattr(table, 'query', broken_query)
+    with pytest.raises(ValueError):
+        latest(app.presence_table)
+    assert len(calls) == 1
+
+def test_exhausted_read_budget_rejects_without_querying(db, monkeypatch):
+    budget = app.ReadCapacityBudget(units_per_second=1, burst=1)
+    budget.consume(100)
+    monkeypatch.setattr(app, 'read_budget', budget)
+    table = db.Table('ProximitySensorData')
+
+    with pytest.raises(app.CapacityExhausted):
+        latest(app.presence_table)
+    assert table.calls == 0
+
+def test_throttled_endpoint_serves_last_good_response_as_stale(db):
+    client = app.app.test_client()
+    fresh = client.get('/api/presence_history')
+    assert fresh.status_code == 200
+
+    app.response_cache.invalidate()
+    db.Table('ProximitySensorData').inject_throttling(rate=1.0)
+    stale = client.get('/api/presence_history')
+
+    assert stale.status_code == 200
+    assert stale.headers['X-Cache'] == 'STALE'
+    body = stale.get_json()
+    assert body['stale'] is True
+    assert body['sessions'] == fresh.get_json()['sessions']
+
+def test_throttled_endpoint_without_cached_response_returns_503(db):
+    db.Table('ProximitySensorData').inject_throttling(rate=1.0)
+
+    response = app.app.test_client().get('/api/presence_history')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
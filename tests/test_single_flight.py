@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from app import SingleFlight
+
+THREADS = 16
+
+def run_concurrently(flight, fn, key='k'):
+    """Start THREADS callers of flight.do(key, fn); returns (results, errors)"""
+    results, errors = [], []
+    lock = threading.Lock()
+
+    def call():
+        try:
+            value = flight.do(key, fn, route='/test')
+            with lock:
+                results.append(value)
+        except Exception as e:
+            with lock:
+                errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+def wait_for_callers(flight, timeout=5):
+    """Block until all THREADS callers have entered do() (one leader, the rest collapsed)"""
+    deadline = time.monotonic() + timeout
+    while flight.stats()['leaders'] + flight.stats()['collapsed'] < THREADS:
+        assert time.monotonic() < deadline, 'callers did not all reach SingleFlight.do'
+        time.sleep(0.001)
+
+def test_concurrent_callers_share_one_call_and_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return object()
+
+    threads, results, errors = run_concurrently(flight, fn)
+    # Hold the leader until every follower has joined the in-flight call
+    wait_for_callers(flight)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert errors == []
+    assert len(results) == THREADS and all(r is results[0] for r in results)
+    stats = flight.stats()
+    assert stats['leaders'] == 1
+    assert stats['collapsed'] == THREADS - 1
+    assert stats['collapsedByRoute'] == {'/test': THREADS - 1}
+    assert stats['inFlight'] == 0
+
+def test_concurrent_callers_share_one_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    failure = RuntimeError('boom')
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        raise failure
+
+    threads, results, errors = run_concurrently(flight, fn)
+    wait_for_callers(flight)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == []
+    assert len(errors) == THREADS and all(e is failure for e in errors)
+    assert flight.stats()['inFlight'] == 0
+
+def test_completed_call_is_not_reused():
+    flight = SingleFlight()
+    values = iter([1, 2])
+    assert flight.do('k', lambda: next(values)) == 1
+    assert flight.do('k', lambda: next(values)) == 2
+
+def test_distinct_keys_run_independently():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 'a') == 'a'
+    assert flight.do('b', lambda: 'b') == 'b'
+    assert flight.stats()['leaders'] == 2
+
+def test_error_does_not_poison_next_call():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError('x')
+
+    with pytest.raises(ValueError):
+        flight.do('k', fail)
+    assert flight.do('k', lambda: 'ok') == 'ok'